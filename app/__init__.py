@@ -6,6 +6,20 @@ from dotenv import load_dotenv, find_dotenv
 from flask_session import Session  # <-- Ajouté
 import getpass
 
+def configure_logging():
+    """Logging : fichier + stdout (docker logs / Dozzle), sur le logger racine."""
+    log_handler = RotatingFileHandler("app.log", maxBytes=5 * 1024 * 1024, backupCount=3)
+    log_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+
+    logger = logging.getLogger()  # Logger racine
+    logger.setLevel(logging.INFO)
+    logger.addHandler(log_handler)
+    logger.addHandler(stream_handler)
+    return logger
+
 def create_app():
     load_dotenv(find_dotenv(), override=True)
     
@@ -17,11 +31,58 @@ def create_app():
         app.logger.warning("SECRET_KEY not set, using generated key. Set SECRET_KEY in environment for production.")
     app.secret_key = secret_key
     app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16 MB
+    # Taille max du cache de parsing Olex (cache/olex_routes), éviction LRU
+    app.config["PARSE_CACHE_MAX_BYTES"] = int(os.getenv("PARSE_CACHE_MAX_MB", "256")) * 1024 * 1024
+    # Export groupé : taille de lot à partir de laquelle le pool de processus est utilisé
+    app.config["BATCH_EXPORT_PARALLEL_MIN"] = int(os.getenv("BATCH_EXPORT_PARALLEL_MIN", "8"))
     
     # Configuration WorldTides API
     app.config["WORLDTIDES_API_KEY"] = os.getenv("WORLDTIDES_API_KEY")
     if not app.config["WORLDTIDES_API_KEY"]:
         app.logger.warning("WORLDTIDES_API_KEY not set. GPX bathymetry conversion will not work.")
+    # Tolérance (km) pour réutiliser la série de marée d'une position déjà en cache (0 = désactivé)
+    app.config["TIDE_SNAP_KM"] = float(os.getenv("TIDE_SNAP_KM", "1.0"))
+    # Cache des séries de marée : LRU mémoire par worker + fichiers partagés (cache/worldtides/series)
+    app.config["TIDE_MEMORY_CACHE_BYTES"] = int(os.getenv("TIDE_MEMORY_CACHE_MB", "32")) * 1024 * 1024
+    app.config["TIDE_SHARED_CACHE"] = os.getenv("TIDE_SHARED_CACHE", "1") not in ("0", "false", "False", "")
+    app.config["TIDE_SHARED_CACHE_BYTES"] = int(os.getenv("TIDE_SHARED_CACHE_MB", "128")) * 1024 * 1024
+    from . import tide_cache
+    tide_cache_settings = {
+        "memory_max_bytes": app.config["TIDE_MEMORY_CACHE_BYTES"],
+        "shared": app.config["TIDE_SHARED_CACHE"],
+        "shared_max_bytes": app.config["TIDE_SHARED_CACHE_BYTES"],
+    }
+    tide_cache.configure(**tide_cache_settings)
+    # Export XYZ groupé : appels WorldTides simultanés (threads)
+    app.config["TIDE_FETCH_THREADS"] = int(os.getenv("TIDE_FETCH_THREADS", "4"))
+    # Client WorldTides : URL (surchargeable pour un serveur de test local), réessais avec backoff et disjoncteur
+    app.config["WORLDTIDES_URL"] = os.getenv("WORLDTIDES_URL") or None
+    app.config["TIDE_API_TIMEOUT"] = float(os.getenv("TIDE_API_TIMEOUT", "20"))
+    app.config["TIDE_API_RETRIES"] = int(os.getenv("TIDE_API_RETRIES", "2"))
+    app.config["TIDE_BREAKER_THRESHOLD"] = int(os.getenv("TIDE_BREAKER_THRESHOLD", "5"))
+    app.config["TIDE_BREAKER_COOLDOWN"] = float(os.getenv("TIDE_BREAKER_COOLDOWN", "60"))
+    from . import tide_client
+    tide_client_settings = {
+        "timeout": app.config["TIDE_API_TIMEOUT"],
+        "retries": app.config["TIDE_API_RETRIES"],
+        "breaker_threshold": app.config["TIDE_BREAKER_THRESHOLD"],
+        "breaker_cooldown": app.config["TIDE_BREAKER_COOLDOWN"],
+    }
+    tide_client.configure(**tide_client_settings)
+    # Pools de processus par worker web : exports groupés (servis dans la requête)
+    # et tâches de fond gpx2xyz, séparés ; la configuration est rejouée dans leurs processus
+    app.config["PROCESS_POOL_WORKERS"] = int(os.getenv("PROCESS_POOL_WORKERS", "2"))
+    app.config["JOB_POOL_WORKERS"] = int(os.getenv("JOB_POOL_WORKERS", "2"))
+    from . import process_pool
+    process_pool.configure(
+        render_workers=app.config["PROCESS_POOL_WORKERS"],
+        job_workers=app.config["JOB_POOL_WORKERS"],
+        setup=[
+            (configure_logging, {}),
+            (tide_cache.configure, tide_cache_settings),
+            (tide_client.configure, tide_client_settings),
+        ],
+    )
 
     # Configurer Flask-Session pour stockage sur disque
     app.config["SESSION_TYPE"] = "filesystem"
@@ -29,17 +90,7 @@ def create_app():
     app.config["SESSION_PERMANENT"] = False
     Session(app)  # <-- Initialisation de Flask-Session
 
-    # Logging : fichier + stdout (docker logs / Dozzle)
-    log_handler = RotatingFileHandler("app.log", maxBytes=5 * 1024 * 1024, backupCount=3)
-    log_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
-
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
-
-    logger = logging.getLogger()  # Logger racine
-    logger.setLevel(logging.INFO)
-    logger.addHandler(log_handler)
-    logger.addHandler(stream_handler)
+    logger = configure_logging()
 
     # Debug: Log current user and file permissions
     try:
@@ -72,4 +123,18 @@ def create_app():
     except Exception as e:
         app.logger.warning(f"Échec du nettoyage des sessions : {e}")
 
+    # Nettoyage des routes stockées côté serveur
+    try:
+        from .cleanup import cleanup_old_route_uploads
+        cleanup_old_route_uploads(os.path.join(app.root_path, "..", "cache", "routes"))
+    except Exception as e:
+        app.logger.warning(f"Échec du nettoyage du route store : {e}")
+
+    # Nettoyage des tâches de conversion terminées
+    try:
+        from .jobs import cleanup_old_jobs
+        cleanup_old_jobs(os.path.join(app.root_path, "..", "cache", "jobs"))
+    except Exception as e:
+        app.logger.warning(f"Échec du nettoyage des tâches : {e}")
+
     return app
@@ -1,5 +1,6 @@
 # cleanup.py
 import os
+import shutil
 import time
 import logging
 
@@ -21,3 +22,21 @@ def cleanup_old_sessions():
                     logging.info(f"Cleaned up old session file: {path}")
                 except Exception as e:
                     logging.warning(f"Failed to remove session file {path}: {e}")
+
+
+def cleanup_old_route_uploads(store_dir):
+    """Supprime les répertoires d'upload du route store plus vieux que MAX_AGE_SECONDS."""
+    now = time.time()
+    if not os.path.exists(store_dir):
+        return
+
+    for filename in os.listdir(store_dir):
+        path = os.path.join(store_dir, filename)
+        if os.path.isdir(path):
+            age = now - os.path.getmtime(path)
+            if age > MAX_AGE_SECONDS:
+                try:
+                    shutil.rmtree(path)
+                    logging.info(f"Cleaned up old route upload: {path}")
+                except Exception as e:
+                    logging.warning(f"Failed to remove route upload {path}: {e}")
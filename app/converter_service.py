@@ -6,12 +6,25 @@ Ce module encapsule la logique de parsing des fichiers,
 de conversion des données et de génération du fichier RTZ.
 """
 import gzip
-import io
+import hashlib
+import os
 import re
 import xml.etree.ElementTree as ET
+import zipfile
+from array import array
+from xml.sax.saxutils import escape
 from flask import current_app
-from .utils import minutes_to_degrees, is_float
-from .exceptions import InvalidFileError, NoRoutesFoundError
+from .utils import evict_lru_files, minutes_to_degrees, is_float
+from .exceptions import InvalidFileError, InvalidSimplificationError, NoRoutesFoundError
+from .models import Route, pack_routes, unpack_routes
+from . import geometry
+from . import process_pool
+from . import route_store
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 def _sanitize_filename(name):
     """Sanitize filename to prevent path traversal and invalid characters."""
@@ -26,89 +39,221 @@ def _sanitize_filename(name):
         name = name[:100]
     return name or "route"
 
-def _parse_routes_from_lines(lines, process_single_waypoints=False):
-    """Parse les lignes d'un fichier Olex et retourne les routes."""
-    routes = []
-    unnamed_routes = 1
-    single_waypoint_count = 1
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
+# ========== Cache des résultats de parsing ==========
+
+# Version du format/parsing : à incrémenter si le résultat du parsing change
+PARSE_CACHE_VERSION = 1
+DEFAULT_PARSE_CACHE_MAX_BYTES = 256 * 1024 * 1024  # 256 MB
+
+# Compteurs du cache (par processus)
+_parse_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def upload_key(file_stream, process_single_waypoints=False):
+    """
+    Clé de contenu d'un upload : SHA-256 des octets bruts + options de parsing.
+
+    Le flux est relu par blocs puis rembobiné.
+    """
+    digest = hashlib.sha256()
+    file_stream.seek(0)
+    for chunk in iter(lambda: file_stream.read(1024 * 1024), b""):
+        digest.update(chunk)
+    file_stream.seek(0)
+
+    extension = os.path.splitext(file_stream.filename or "")[1].lower()
+    digest.update(f"|{extension}|single={int(bool(process_single_waypoints))}|v{PARSE_CACHE_VERSION}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _parse_cache_path(cache_dir, key):
+    """Retourne le chemin du fichier cache."""
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, f"{key}.routes")
+
+
+def _parse_cache_load(cache_dir, key):
+    """Charge les routes depuis le cache, ou None si absentes."""
+    path = _parse_cache_path(cache_dir, key)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, "rb") as f:
+            routes = unpack_routes(f.read())
+        # LRU : la date de modification sert de date de dernier accès
+        os.utime(path)
+        return routes
+    except Exception as e:
+        current_app.logger.warning(f"Parse cache load failed for {key[:12]}: {e}")
+        return None
+
+
+def _parse_cache_save(cache_dir, key, routes, max_bytes):
+    """Sauvegarde les routes dans le cache puis applique l'éviction LRU."""
+    path = _parse_cache_path(cache_dir, key)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(pack_routes(routes))
+        os.replace(tmp_path, path)
+    except Exception as e:
+        current_app.logger.warning(f"Parse cache save failed for {key[:12]}: {e}")
+        return
+
+    _parse_cache_evict(cache_dir, max_bytes)
+
+
+def _parse_cache_evict(cache_dir, max_bytes):
+    """Supprime les entrées les moins récemment utilisées au-delà de max_bytes."""
+    removed, failed = evict_lru_files(cache_dir, ".routes", max_bytes)
+    _parse_cache_stats["evictions"] += len(removed)
+    for path in removed:
+        current_app.logger.debug(f"Parse cache evicted {os.path.basename(path)}")
+    for path, e in failed:
+        current_app.logger.warning(f"Parse cache eviction failed for {path}: {e}")
+
+
+# ========== Parsing Olex ==========
+
+# États de l'automate de parsing Olex
+_SEEK_ROUTE = 0      # hors route, on attend une ligne "Rute "
+_SEEK_PLOTTSETT = 1  # en-tête de route, on attend "Plottsett"
+_WAYPOINTS = 2       # lecture des waypoints / "Navn" jusqu'à la prochaine route
+
+# Nombre de lignes après "Rute " dans lesquelles "Plottsett" doit apparaître
+_PLOTTSETT_LOOKAHEAD = 9
+
+# Premiers caractères possibles d'une ligne de waypoint ("lat_min lon_min timestamp ...")
+_NUMERIC_START = frozenset("0123456789+-.")
+
+
+def _iter_routes_from_lines(lines, process_single_waypoints=False, vectorized=True):
+    """
+    Parse les lignes d'un fichier Olex en un seul passage et produit les routes
+    au fur et à mesure qu'elles sont complètes.
+
+    `lines` peut être n'importe quel itérable (flux gzip ouvert en mode texte),
+    aucune ligne n'est conservée en dehors de la route en cours.
+
+    Les lignes de waypoints d'une route sont accumulées en bloc puis converties
+    en une fois (NumPy si disponible et si `vectorized`), les "Navn" étant
+    rattachés à l'index du dernier waypoint candidat.
+    """
+    state = _SEEK_ROUTE
+    route_name = None
+    header_lines = 0
+    block = []
+    names = {}
+    counters = {"unnamed": 1, "single": 1}
+
+    for raw_line in lines:
+        line = raw_line.strip()
+
         if line.startswith("Rute "):
+            if state == _WAYPOINTS:
+                route = _convert_waypoint_block(route_name, block, names, vectorized)
+                route = _finalize_route(route, process_single_waypoints, counters)
+                if route is not None:
+                    yield route
+            elif state == _SEEK_PLOTTSETT:
+                current_app.logger.debug(f"No Plottsett line found near route '{route_name}', skipping")
             route_name = line[5:].strip()
             # Remove "Rutetype Strek" suffix if present
             if route_name.endswith("Rutetype Strek"):
                 route_name = route_name[:-len("Rutetype Strek")].strip()
             current_app.logger.debug(f"Found route: '{route_name}'")
-            # Look for Plottsett line within next few lines
-            plottsett_found = False
-            plottsett_index = -1
-            for k in range(1, min(10, len(lines) - i)):  # Check up to 10 lines ahead
-                check_line = lines[i + k].strip()
-                if check_line.startswith("Rute "):
-                    break  # Another route starts, stop looking
-                if "Plottsett" in check_line:
-                    plottsett_found = True
-                    plottsett_index = i + k
-                    break
-
-            if not plottsett_found:
+            state = _SEEK_PLOTTSETT
+            header_lines = 0
+            block = []
+            names = {}
+            continue
+
+        if state == _SEEK_PLOTTSETT:
+            header_lines += 1
+            if "Plottsett" in line:
+                state = _WAYPOINTS
+            elif header_lines >= _PLOTTSETT_LOOKAHEAD:
                 current_app.logger.debug(f"No Plottsett line found near route '{route_name}', skipping")
-                i += 1
-                continue
-
-            # Parse waypoints
-            waypoints = []
-            j = plottsett_index + 1  # Start parsing waypoints after Plottsett line
-            while j < len(lines):
-                line_j = lines[j].strip()
-                if line_j.startswith("Rute "):
-                    break
-
-                parts = line_j.split()
-                if len(parts) >= 3 and all(is_float(p) for p in parts[:3]):
-                    lat_min, lon_min, timestamp = parts[0], parts[1], parts[2]
-                    waypoint = {
-                        "lat": minutes_to_degrees(lat_min),
-                        "lon": minutes_to_degrees(lon_min),
-                        "timestamp": timestamp,
-                        "name": "",
-                    }
-                    waypoints.append(waypoint)
-                elif line_j.startswith("Navn ") and waypoints:
-                    waypoint_name = line_j[5:].strip()
-                    waypoints[-1]["name"] = waypoint_name
-                j += 1
-
-            # Process routes based on waypoint count
-            if len(waypoints) < 1:
-                current_app.logger.debug(f"Skipping route '{route_name}' - no waypoints")
-                i = j
-                continue
-            
-            # Handle single waypoints
-            if len(waypoints) == 1:
-                if not process_single_waypoints:
-                    current_app.logger.debug(f"Skipping route '{route_name}' - single waypoint (not enabled)")
-                    i = j
-                    continue
-                # Mark as single waypoint for later identification
-                route_name = f"Waypoint {single_waypoint_count}"
-                single_waypoint_count += 1
-            else:
-                # Assign a default name if unnamed (multi-waypoint routes)
-                if route_name == "uten navn":
-                    route_name = f"Route {unnamed_routes}"
-                    unnamed_routes += 1
-
-            if waypoints:
-                routes.append({"route_name": route_name, "waypoints": waypoints})
-                current_app.logger.info(f"Parsed route '{route_name}' with {len(waypoints)} waypoints")
-            i = j
+                state = _SEEK_ROUTE
+        elif state == _WAYPOINTS:
+            if line[:1] in _NUMERIC_START:
+                block.append(line)
+            elif line.startswith("Navn "):
+                if block:
+                    names[len(block) - 1] = line[5:].strip()
+            elif _is_waypoint_line(line):
+                # Cas rares ("nan", "inf"...) acceptés par float()
+                block.append(line)
+
+    if state == _WAYPOINTS:
+        route = _convert_waypoint_block(route_name, block, names, vectorized)
+        route = _finalize_route(route, process_single_waypoints, counters)
+        if route is not None:
+            yield route
+
+
+def _is_waypoint_line(line):
+    """Indique si une ligne commence par trois valeurs numériques."""
+    parts = line.split()
+    return len(parts) >= 3 and all(is_float(p) for p in parts[:3])
+
+
+def _convert_waypoint_block(route_name, block, names, vectorized=True):
+    """
+    Convertit un bloc de lignes de waypoints candidates en `Route`.
+
+    Le chemin NumPy parse tout le bloc d'un coup ; si une ligne est mal formée
+    (ou si NumPy est absent) on repasse sur le parsing ligne à ligne.
+    """
+    if not block:
+        return Route(route_name)
+
+    if vectorized and np is not None:
+        try:
+            values = np.loadtxt(block, dtype=float, usecols=(0, 1, 2), comments=None, ndmin=2)
+        except ValueError:
+            current_app.logger.debug(f"Malformed waypoint block ({len(block)} lines), using line parser")
         else:
-            i += 1
-    current_app.logger.info(f"Total routes parsed: {len(routes)}")
-    return routes
+            # Minutes -> degrés pour toute la colonne
+            columns = []
+            for column in (values[:, 0] / 60.0, values[:, 1] / 60.0, values[:, 2]):
+                arr = array("d")
+                arr.frombytes(np.ascontiguousarray(column, dtype=np.float64).tobytes())
+                columns.append(arr)
+            return Route(route_name, columns[0], columns[1], columns[2], dict(names))
+
+    route = Route(route_name)
+    for idx, line in enumerate(block):
+        parts = line.split()
+        if len(parts) >= 3 and all(is_float(p) for p in parts[:3]):
+            route.append(minutes_to_degrees(parts[0]), minutes_to_degrees(parts[1]), float(parts[2]))
+        if idx in names and len(route):
+            route.names[len(route) - 1] = names[idx]
+    return route
+
+
+def _finalize_route(route, process_single_waypoints, counters):
+    """Applique les règles de nommage/filtrage à une route terminée."""
+    if len(route) < 1:
+        current_app.logger.debug(f"Skipping route '{route.route_name}' - no waypoints")
+        return None
+
+    # Handle single waypoints
+    if len(route) == 1:
+        if not process_single_waypoints:
+            current_app.logger.debug(f"Skipping route '{route.route_name}' - single waypoint (not enabled)")
+            return None
+        # Mark as single waypoint for later identification
+        route.route_name = f"Waypoint {counters['single']}"
+        counters["single"] += 1
+    elif route.route_name == "uten navn":
+        # Assign a default name if unnamed (multi-waypoint routes)
+        route.route_name = f"Route {counters['unnamed']}"
+        counters["unnamed"] += 1
+
+    current_app.logger.info(f"Parsed route '{route.route_name}' with {len(route)} waypoints")
+    return route
 
 def _parse_rtz_file(file_stream):
     """Parse un fichier RTZ et retourne les routes."""
@@ -124,131 +269,288 @@ def _parse_rtz_file(file_stream):
         route_info = root.find("rtz:routeInfo", ns_map)
         route_name = route_info.get("routeName") if route_info is not None else "Unnamed RTZ Route"
 
-        waypoints = []
+        route = Route(route_name)
         waypoints_el = root.find("rtz:waypoints", ns_map)
         if waypoints_el is not None:
             for wp_el in waypoints_el.findall("rtz:waypoint", ns_map):
                 pos = wp_el.find("rtz:position", ns_map)
                 if pos is not None:
-                    waypoints.append({
-                        "lat": float(pos.get("lat")),
-                        "lon": float(pos.get("lon")),
-                        "name": wp_el.get("name", ""),
-                    })
+                    route.append(float(pos.get("lat")), float(pos.get("lon")), name=wp_el.get("name", ""))
         
-        if not waypoints:
+        if not len(route):
             return []
             
-        return [{"route_name": route_name, "waypoints": waypoints}]
+        return [route]
 
     except ET.ParseError as e:
         current_app.logger.error(f"RTZ file parsing failed for stream. Error: {e}", exc_info=True)
         raise InvalidFileError(f"Error parsing RTZ file: {e}")
 
-def process_uploaded_file(file_stream, process_single_waypoints=False):
+def process_uploaded_file(file_stream, process_single_waypoints=False,
+                          cache_dir=None, cache_max_bytes=None, key=None):
     """
     Traite un fichier olexplot.gz ou .rtz uploadé.
+
+    Si `cache_dir` est fourni, le résultat est mis en cache par contenu
+    (voir `upload_key`, ou `key` si déjà calculée) et un upload identique
+    ne repasse ni par gzip ni par le parsing.
     """
     filename = file_stream.filename
+    if not filename.endswith((".gz", ".rtz")):
+        raise InvalidFileError(f"Unsupported file type: {filename}")
+
+    if cache_dir:
+        key = key or upload_key(file_stream, process_single_waypoints)
+        routes = _parse_cache_load(cache_dir, key)
+        if routes:
+            _parse_cache_stats["hits"] += 1
+            current_app.logger.info(
+                f"Parse cache HIT {key[:12]} for {filename} "
+                f"(hits={_parse_cache_stats['hits']}, misses={_parse_cache_stats['misses']})"
+            )
+            return routes
+        _parse_cache_stats["misses"] += 1
+        current_app.logger.info(
+            f"Parse cache MISS {key[:12]} for {filename} "
+            f"(hits={_parse_cache_stats['hits']}, misses={_parse_cache_stats['misses']})"
+        )
+
     if filename.endswith(".gz"):
         try:
             with gzip.open(file_stream, "rt", encoding="utf-8", errors="ignore") as f:
-                lines = f.readlines()
-            routes = _parse_routes_from_lines(lines, process_single_waypoints=process_single_waypoints)
+                routes = list(_iter_routes_from_lines(f, process_single_waypoints=process_single_waypoints))
+            current_app.logger.info(f"Total routes parsed: {len(routes)}")
         except Exception as e:
             current_app.logger.error(f"GZ file processing failed for {filename}. Error: {e}", exc_info=True)
             raise InvalidFileError(f"Error during GZ file decompression: {e}")
-    elif filename.endswith(".rtz"):
-        routes = _parse_rtz_file(file_stream)
     else:
-        raise InvalidFileError(f"Unsupported file type: {filename}")
+        routes = _parse_rtz_file(file_stream)
 
     if not routes:
         raise NoRoutesFoundError("No valid routes found in the uploaded file.")
 
-    for r in routes:
-        for wp in r["waypoints"]:
-            lat_deg = abs(int(wp["lat"]))
-            lat_min = (abs(wp["lat"]) - lat_deg) * 60
-            lon_deg = abs(int(wp["lon"]))
-            lon_min = (abs(wp["lon"]) - lon_deg) * 60
-            lat_dir = "N" if wp["lat"] >= 0 else "S"
-            lon_dir = "E" if wp["lon"] >= 0 else "W"
-            wp["lat_display"] = f"{lat_deg:02d}° {lat_min:06.3f}' {lat_dir}"
-            wp["lon_display"] = f"{lon_deg:03d}° {lon_min:06.3f}' {lon_dir}"
-    
+    if cache_dir:
+        _parse_cache_save(cache_dir, key, routes, cache_max_bytes or DEFAULT_PARSE_CACHE_MAX_BYTES)
+
     return routes
 
-def generate_rtz_file(stored_routes, selected_route_name, new_name=None):
-    """
-    Génère un fichier RTZ à partir d'une route sélectionnée.
+# ========== Écriture RTZ/GPX en flux ==========
+
+# Nombre de waypoints sérialisés par morceau émis
+_WRITE_CHUNK_WAYPOINTS = 1000
+
+_XML_DECLARATION = "<?xml version='1.0' encoding='utf-8'?>\n"
+_ATTR_ENTITIES = {'"': "&quot;", "\r": "&#13;", "\n": "&#10;", "\t": "&#09;"}
+
+
+def _xml_attr(value):
+    """Échappe une valeur d'attribut XML (mêmes règles qu'ElementTree)."""
+    return escape(value, _ATTR_ENTITIES)
+
+
+def _iter_chunks(route, render_waypoint):
+    """Sérialise les waypoints d'une route par morceaux de _WRITE_CHUNK_WAYPOINTS."""
+    lats, lons = route.lats, route.lons
+    for start in range(0, len(route), _WRITE_CHUNK_WAYPOINTS):
+        stop = min(start + _WRITE_CHUNK_WAYPOINTS, len(route))
+        yield "".join(
+            render_waypoint(idx, lats[idx], lons[idx], route.name_at(idx)) for idx in range(start, stop)
+        ).encode("utf-8")
+
+
+def _rtz_waypoint(idx, lat, lon, name):
+    return (
+        f'<waypoint id="{idx + 1}" name="{_xml_attr(name)}">'
+        f'<position lat="{lat:.8f}" lon="{lon:.8f}" />'
+        f'<leg legInfo="" />'
+        f'</waypoint>'
+    )
+
+
+def _gpx_waypoint(idx, lat, lon, name):
+    if name:
+        return f'<rtept lat="{lat:.8f}" lon="{lon:.8f}"><name>{escape(name)}</name></rtept>'
+    return f'<rtept lat="{lat:.8f}" lon="{lon:.8f}" />'
+
+
+def iter_rtz_xml(route, route_name):
+    """Génère le document RTZ d'une route par morceaux d'octets."""
+    yield (
+        _XML_DECLARATION
+        + '<route xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        'xmlns:xsd="http://www.w3.org/2001/XMLSchema" '
+        'xmlns="http://www.cirm.org/RTZ/1/0" version="1.0">'
+        f'<routeInfo routeName="{_xml_attr(route_name)}" />'
+        '<waypoints><defaultWaypoint radius="0.30" />'
+    ).encode("utf-8")
+    yield from _iter_chunks(route, _rtz_waypoint)
+    yield b"</waypoints></route>"
+
+
+def iter_gpx_xml(route, route_name):
+    """Génère le document GPX d'une route par morceaux d'octets."""
+    yield (
+        _XML_DECLARATION
+        + '<gpx version="1.1" creator="Olex2RTZ">'
+        f'<rte><name>{escape(route_name)}</name>'
+    ).encode("utf-8")
+    yield from _iter_chunks(route, _gpx_waypoint)
+    yield b"</rte></gpx>"
+
+
+# ========== Simplification avant export ==========
+
+MIN_SIMPLIFY_POINTS = 2
+
+
+def simplify_route(route, tolerance_m=None, max_points=None):
     """
-    selected_route = next((r for r in stored_routes if r["route_name"] == selected_route_name), None)
+    Simplifie une route avant export (limites de waypoints des traceurs/ECDIS).
 
-    if not selected_route:
+    tolerance_m : Douglas-Peucker, écart maximal en mètres avec la route d'origine
+    max_points  : nombre de waypoints visé (les plus significatifs au sens de
+                  Douglas-Peucker)
+
+    Les extrémités et les waypoints nommés sont toujours conservés.
+    Retourne la route simplifiée (la route d'origine si rien n'est retiré).
+    """
+    if not route:
         raise NoRoutesFoundError("Selected route not found.")
+    if (tolerance_m is None) == (max_points is None):
+        raise InvalidSimplificationError("Choose either a tolerance or a maximum number of waypoints.")
 
-    route_name_to_use = _sanitize_filename(new_name.strip() if new_name else selected_route["route_name"])
+    keep = list(route.names)
+    if tolerance_m is not None:
+        if not tolerance_m > 0 or tolerance_m == float("inf"):
+            raise InvalidSimplificationError("The simplification tolerance must be a positive number of metres.")
+        indices = geometry.simplify_indices(route.lats, route.lons, tolerance_m, keep=keep)
+    else:
+        if max_points < MIN_SIMPLIFY_POINTS:
+            raise InvalidSimplificationError(f"The maximum number of waypoints must be at least {MIN_SIMPLIFY_POINTS}.")
+        indices = geometry.simplify_to_count(route.lats, route.lons, max_points, keep=keep)
 
-    root = ET.Element("route", {
-        "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
-        "xmlns:xsd": "http://www.w3.org/2001/XMLSchema",
-        "xmlns": "http://www.cirm.org/RTZ/1/0",
-        "version": "1.0",
-    })
-    ET.SubElement(root, "routeInfo", {"routeName": route_name_to_use})
-    waypoints_el = ET.SubElement(root, "waypoints")
-    ET.SubElement(waypoints_el, "defaultWaypoint", {"radius": "0.30"})
+    if len(indices) == len(route):
+        return route
+    current_app.logger.info(f"Simplified route '{route.route_name}' from {len(route)} to {len(indices)} waypoints")
+    return route.take(indices)
 
-    for idx, waypoint in enumerate(selected_route["waypoints"], start=1):
-        wp = ET.SubElement(waypoints_el, "waypoint", {"id": str(idx), "name": waypoint["name"] or ""})
-        ET.SubElement(wp, "position", {"lat": f"{waypoint['lat']:.8f}", "lon": f"{waypoint['lon']:.8f}"})
-        ET.SubElement(wp, "leg", {"legInfo": ""})
 
-    xml_data = io.BytesIO()
-    tree = ET.ElementTree(root)
-    tree.write(xml_data, encoding="utf-8", xml_declaration=True)
-    xml_data.seek(0)
+def generate_rtz_file(selected_route, new_name=None):
+    """
+    Génère un fichier RTZ à partir d'une route sélectionnée.
 
+    Retourne: (download_name, générateur de morceaux d'octets)
+    """
+    if not selected_route:
+        raise NoRoutesFoundError("Selected route not found.")
+
+    route_name_to_use = _sanitize_filename(new_name.strip() if new_name else selected_route.route_name)
     download_name = f"{route_name_to_use}.rtz"
-    
-    return download_name, xml_data
 
-def generate_gpx_file(stored_routes, selected_route_name, new_name=None):
+    return download_name, iter_rtz_xml(selected_route, route_name_to_use)
+
+def generate_gpx_file(selected_route, new_name=None):
     """
     Génère un fichier GPX à partir d'une route sélectionnée.
-    """
-    selected_route = next((r for r in stored_routes if r["route_name"] == selected_route_name), None)
 
+    Retourne: (download_name, générateur de morceaux d'octets)
+    """
     if not selected_route:
         raise NoRoutesFoundError("Selected route not found.")
 
-    route_name_to_use = _sanitize_filename(new_name.strip() if new_name else selected_route["route_name"])
+    route_name_to_use = _sanitize_filename(new_name.strip() if new_name else selected_route.route_name)
+    download_name = f"{route_name_to_use}.gpx"
 
-    gpx_ns = "http://www.topografix.com/GPX/1/1"
-    ET.register_namespace("", gpx_ns)
+    return download_name, iter_gpx_xml(selected_route, route_name_to_use)
 
-    root = ET.Element("gpx", {
-        "version": "1.1",
-        "creator": "Olex2RTZ",
-    })
 
-    rte_el = ET.SubElement(root, "rte")
-    ET.SubElement(rte_el, "name").text = route_name_to_use
+# ========== Export groupé (ZIP) ==========
 
-    for waypoint in selected_route["waypoints"]:
-        rtept_el = ET.SubElement(rte_el, "rtept", {
-            "lat": f"{waypoint['lat']:.8f}",
-            "lon": f"{waypoint['lon']:.8f}"
-        })
-        if waypoint.get("name"):
-            ET.SubElement(rtept_el, "name").text = waypoint["name"]
+# Formats d'export : extension -> générateur
+EXPORT_FORMATS = {
+    "rtz": generate_rtz_file,
+    "gpx": generate_gpx_file,
+}
 
-    xml_data = io.BytesIO()
-    tree = ET.ElementTree(root)
-    tree.write(xml_data, encoding="utf-8", xml_declaration=True)
-    xml_data.seek(0)
+class _ZipStreamBuffer:
+    """Tampon non-seekable dans lequel ZipFile écrit ; vidé à chaque morceau émis."""
 
-    download_name = f"{route_name_to_use}.gpx"
-    
-    return download_name, xml_data
\ No newline at end of file
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_zip_archive(entries):
+    """
+    Génère une archive ZIP en flux.
+
+    entries: itérable de (nom_dans_archive, itérable de morceaux d'octets) ;
+    chaque entrée est compressée et émise au fur et à mesure.
+    """
+    buffer = _ZipStreamBuffer()
+    used_names = set()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for arcname, chunks in entries:
+            base, ext = os.path.splitext(arcname)
+            counter = 2
+            while arcname in used_names:
+                arcname = f"{base} ({counter}){ext}"
+                counter += 1
+            used_names.add(arcname)
+
+            with archive.open(arcname, "w") as entry:
+                for chunk in chunks:
+                    entry.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+    yield buffer.drain()
+
+
+def render_stored_route(store_dir, upload_id, route_id, fmt):
+    """
+    Charge une route du route store et génère le fichier complet.
+
+    Exécutée dans les processus du pool d'export (pas de contexte Flask).
+    Retourne: (download_name, bytes)
+    """
+    route = route_store.load_route(store_dir, upload_id, route_id)
+    download_name, chunks = EXPORT_FORMATS[fmt](route)
+    return download_name, b"".join(chunks)
+
+
+def iter_batch_entries(store_dir, upload_id, route_ids, formats, max_workers=1):
+    """
+    Produit les entrées (nom, morceaux) d'un export groupé.
+
+    Avec max_workers > 1 les fichiers sont générés en parallèle dans le pool de
+    processus d'export ; au plus 2 * max_workers fichiers sont en attente en mémoire.
+    """
+    jobs = [(route_id, fmt) for route_id in route_ids for fmt in formats]
+
+    if max_workers <= 1 or len(jobs) < 2:
+        for route_id, fmt in jobs:
+            yield EXPORT_FORMATS[fmt](route_store.load_route(store_dir, upload_id, route_id))
+        return
+
+    window = 2 * max_workers
+    pending = []
+    for route_id, fmt in jobs:
+        pending.append(process_pool.submit(process_pool.RENDER, render_stored_route, store_dir, upload_id, route_id, fmt))
+        if len(pending) >= window:
+            download_name, data = pending.pop(0).result()
+            yield download_name, (data,)
+    for future in pending:
+        download_name, data = future.result()
+        yield download_name, (data,)
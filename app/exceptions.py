@@ -13,4 +13,16 @@ class InvalidFileError(Olex2RtzError):
 
 class NoRoutesFoundError(Olex2RtzError):
     """Levée si aucune route valide n'est trouvée dans le fichier."""
+    pass
+
+class InvalidSimplificationError(Olex2RtzError):
+    """Levée si les paramètres de simplification d'une route sont invalides."""
+    pass
+
+class TideApiError(Olex2RtzError, RuntimeError):
+    """Levée si l'API de marée (WorldTides) est injoignable ou répond en erreur."""
+    pass
+
+class TideCircuitOpenError(TideApiError):
+    """Levée sans appel réseau tant que le disjoncteur du client de marée est ouvert."""
     pass
\ No newline at end of file
@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""
+Simplification des polylignes affichées sur les cartes (Douglas-Peucker).
+
+Les coordonnées sont projetées en mètres (équirectangulaire centrée sur la
+latitude moyenne, suffisant à l'échelle d'une route ou d'un segment), puis
+simplifiées avec une tolérance exprimée en mètres. La tolérance d'un niveau
+de zoom correspond à la taille d'un pixel de carte Web Mercator.
+
+Les points NaN sont ignorés ; les indices retournés sont ceux des colonnes
+d'origine, ce qui permet de conserver des points imposés (waypoints nommés).
+"""
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Version des géométries servies : à incrémenter si la simplification change (ETag)
+GEOMETRY_VERSION = 1
+
+EARTH_RADIUS_M = 6371008.8
+# Mètres par pixel au zoom 0 à l'équateur (tuiles 256 px Web Mercator)
+_MERCATOR_M_PER_PX = 2 * math.pi * 6378137.0 / 256
+
+DEFAULT_PIXEL_TOLERANCE = 1.0  # écart maximal toléré, en pixels écran
+OVERVIEW_PIXELS = 1024         # taille de carte supposée pour la vue d'ensemble
+MAX_OVERVIEW_POINTS = 5000     # au-delà, la tolérance de la vue d'ensemble est doublée
+MAX_DETAIL_POINTS = 20000      # idem pour le détail d'une vue
+MAX_ZOOM = 19
+COORD_DECIMALS = 6             # ~0.1 m, largement sous le pixel au zoom max
+
+
+def zoom_tolerance_m(zoom, lat, pixels=DEFAULT_PIXEL_TOLERANCE):
+    """Tolérance en mètres correspondant à `pixels` pixels au zoom donné."""
+    zoom = min(max(zoom, 0), MAX_ZOOM)
+    return pixels * _MERCATOR_M_PER_PX * math.cos(math.radians(lat)) / (2 ** zoom)
+
+
+def _valid_indices(lats, lons):
+    """Indices des points dont les deux coordonnées sont définies."""
+    if np is not None:
+        lat_a = np.asarray(lats, dtype=np.float64)
+        lon_a = np.asarray(lons, dtype=np.float64)
+        return np.flatnonzero(~(np.isnan(lat_a) | np.isnan(lon_a)))
+    return [i for i, (lat, lon) in enumerate(zip(lats, lons)) if not (math.isnan(lat) or math.isnan(lon))]
+
+
+def _project(lats, lons, indices):
+    """Projection équirectangulaire locale (mètres) des points retenus."""
+    if np is not None:
+        lat_a = np.asarray(lats, dtype=np.float64)[indices]
+        lon_a = np.asarray(lons, dtype=np.float64)[indices]
+        lat0 = float(lat_a.mean())
+        lon0 = float(lon_a[0])
+        dlon = (lon_a - lon0 + 180.0) % 360.0 - 180.0  # antiméridien
+        x = np.radians(dlon) * (EARTH_RADIUS_M * math.cos(math.radians(lat0)))
+        y = np.radians(lat_a - lat0) * EARTH_RADIUS_M
+        return x, y
+
+    pts_lat = [lats[i] for i in indices]
+    pts_lon = [lons[i] for i in indices]
+    lat0 = sum(pts_lat) / len(pts_lat)
+    lon0 = pts_lon[0]
+    scale = EARTH_RADIUS_M * math.cos(math.radians(lat0))
+    x = [math.radians((lon - lon0 + 180.0) % 360.0 - 180.0) * scale for lon in pts_lon]
+    y = [math.radians(lat - lat0) * EARTH_RADIUS_M for lat in pts_lat]
+    return x, y
+
+
+def _rdp_significance_numpy(x, y, tolerance):
+    """
+    Douglas-Peucker itératif, un niveau de découpage à la fois.
+
+    Tous les intervalles ouverts d'un niveau sont traités ensemble : distance
+    (au carré) de chaque point intérieur au segment [début, fin] de son
+    intervalle, max par intervalle (reduceat), puis découpage des intervalles
+    hors tolérance.
+
+    Retourne, pour chaque point, son importance au carré : inf pour les
+    extrémités, min des écarts max de ses intervalles ancêtres pour un point
+    de découpage, -1 pour les points écartés. Les points d'importance
+    supérieure à une tolérance t >= `tolerance` forment le résultat de
+    Douglas-Peucker à la tolérance t.
+    """
+    n = len(x)
+    tolerance2 = tolerance * tolerance
+    significance = np.full(n, -1.0)
+    significance[0] = significance[-1] = np.inf
+    starts = np.array([0], dtype=np.int64)
+    ends = np.array([n - 1], dtype=np.int64)
+    parents = np.array([np.inf])
+
+    while starts.size:
+        lengths = ends - starts - 1
+        open_ = lengths > 0
+        starts, ends, lengths, parents = starts[open_], ends[open_], lengths[open_], parents[open_]
+        if not starts.size:
+            break
+
+        bounds = np.cumsum(lengths) - lengths
+        idx = np.repeat(starts + 1 - bounds, lengths) + np.arange(int(lengths.sum()))
+
+        # Grandeurs par intervalle, puis répétées pour chaque point intérieur
+        seg_dx = x[ends] - x[starts]
+        seg_dy = y[ends] - y[starts]
+        seg_len2 = seg_dx * seg_dx + seg_dy * seg_dy
+        inv_len2 = np.divide(1.0, seg_len2, out=np.zeros_like(seg_len2), where=seg_len2 > 0)
+        dx = np.repeat(seg_dx, lengths)
+        dy = np.repeat(seg_dy, lengths)
+
+        # Distance (au carré) de chaque point au segment [début, fin]
+        px = x[idx] - np.repeat(x[starts], lengths)
+        py = y[idx] - np.repeat(y[starts], lengths)
+        t = px * dx
+        t += py * dy
+        t *= np.repeat(inv_len2, lengths)
+        np.clip(t, 0.0, 1.0, out=t)
+        px -= t * dx
+        py -= t * dy
+        dist2 = px * px
+        dist2 += py * py
+
+        dmax2 = np.maximum.reduceat(dist2, bounds)
+        # Premier point atteignant le max de chaque intervalle
+        positions = np.where(dist2 == np.repeat(dmax2, lengths), np.arange(dist2.size), dist2.size)
+        split = idx[np.minimum.reduceat(positions, bounds)]
+
+        over = dmax2 > tolerance2
+        split, level = split[over], np.minimum(dmax2[over], parents[over])
+        significance[split] = level
+        starts = np.concatenate((starts[over], split))
+        ends = np.concatenate((split, ends[over]))
+        parents = np.concatenate((level, level))
+
+    return significance
+
+
+def _rdp_significance_python(x, y, tolerance):
+    """Douglas-Peucker sans numpy (même géométrie que la version vectorisée)."""
+    n = len(x)
+    significance = [-1.0] * n
+    significance[0] = significance[-1] = math.inf
+    stack = [(0, n - 1, math.inf)]
+    while stack:
+        start, end, parent = stack.pop()
+        if end - start < 2:
+            continue
+        ax, ay = x[start], y[start]
+        dx, dy = x[end] - ax, y[end] - ay
+        seg_len2 = dx * dx + dy * dy
+        inv_len2 = 1.0 / seg_len2 if seg_len2 > 0 else 0.0
+        dmax2, split = -1.0, start
+        for i in range(start + 1, end):
+            px, py = x[i] - ax, y[i] - ay
+            t = min(max((px * dx + py * dy) * inv_len2, 0.0), 1.0)
+            px -= t * dx
+            py -= t * dy
+            dist2 = px * px + py * py
+            if dist2 > dmax2:
+                dmax2, split = dist2, i
+        if dmax2 > tolerance * tolerance:
+            level = min(dmax2, parent)
+            significance[split] = level
+            stack.append((start, split, level))
+            stack.append((split, end, level))
+    return significance
+
+
+def _significance(lats, lons, tolerance):
+    """(indices valides, importance au carré de chacun) ; voir _rdp_significance_numpy."""
+    valid = _valid_indices(lats, lons)
+    if len(valid) <= 2:
+        return valid, [math.inf] * len(valid)
+    x, y = _project(lats, lons, valid)
+    if np is not None:
+        return valid, _rdp_significance_numpy(x, y, tolerance)
+    return valid, _rdp_significance_python(x, y, tolerance)
+
+
+def simplify_indices(lats, lons, tolerance_m, keep=None):
+    """
+    Indices (croissants) des points conservés par Douglas-Peucker.
+
+    lats, lons  : séquences de float (array('d'), memoryview, ndarray...)
+    tolerance_m : écart maximal en mètres entre la polyligne simplifiée et l'originale
+    keep        : indices à conserver quoi qu'il arrive (ex: waypoints nommés)
+    """
+    valid, significance = _significance(lats, lons, tolerance_m)
+    if np is not None:
+        kept = np.asarray(valid, dtype=np.int64)[np.asarray(significance) >= 0].tolist()
+    else:
+        kept = [i for i, level in zip(valid, significance) if level >= 0]
+    if keep:
+        kept = sorted(set(kept).union(keep))
+    return kept
+
+
+def simplify_to_count(lats, lons, max_points, keep=None):
+    """
+    Indices (croissants) des `max_points` points les plus importants au sens de
+    Douglas-Peucker : résultat identique à une simplification à la tolérance
+    qui donne ce nombre de points.
+
+    Les extrémités et les indices de `keep` sont toujours conservés, quitte à
+    dépasser max_points s'ils sont plus nombreux.
+    """
+    valid, significance = _significance(lats, lons, 0.0)
+    keep = set(keep or ())
+    if np is not None:
+        significance = np.asarray(significance, dtype=np.float64)
+        valid = np.asarray(valid, dtype=np.int64)
+        if keep:
+            significance[np.isin(valid, list(keep))] = np.inf
+        # Tri décroissant stable : à importance égale, le premier point d'abord
+        order = np.argsort(-significance, kind="stable")
+        count = max(max_points, int(np.count_nonzero(np.isinf(significance))))
+        chosen = order[:count]
+        chosen = chosen[significance[chosen] >= 0]
+        return sorted(valid[chosen].tolist())
+
+    ranked = sorted(
+        range(len(valid)),
+        key=lambda k: -(math.inf if valid[k] in keep else significance[k]),
+    )
+    mandatory = sum(1 for k in ranked if valid[k] in keep or math.isinf(significance[k]))
+    chosen = [k for k in ranked[:max(max_points, mandatory)] if valid[k] in keep or significance[k] >= 0]
+    return sorted(valid[k] for k in chosen)
+
+
+def extent_m(lats, lons):
+    """Plus grande dimension (mètres) de l'emprise des points valides, ou 0."""
+    valid = _valid_indices(lats, lons)
+    if len(valid) < 2:
+        return 0.0
+    x, y = _project(lats, lons, valid)
+    return float(max(max(x) - min(x), max(y) - min(y)))
+
+
+def simplify_overview(lats, lons, keep=None, max_points=MAX_OVERVIEW_POINTS, pixels=DEFAULT_PIXEL_TOLERANCE):
+    """
+    Vue d'ensemble : tolérance d'un pixel, doublée tant que le résultat dépasse
+    max_points (tracés très bruités).
+
+    Retourne: (indices, tolérance effective en mètres)
+    """
+    extent = extent_m(lats, lons)
+    tolerance = pixels * extent / OVERVIEW_PIXELS
+    indices = simplify_indices(lats, lons, tolerance, keep=keep)
+    while len(indices) > max_points and 0 < tolerance < extent:
+        tolerance *= 2
+        indices = simplify_indices(lats, lons, tolerance, keep=keep)
+    return indices, tolerance
+
+
+def bounds(lats, lons):
+    """Emprise [sud, ouest, nord, est] des points valides, ou None."""
+    valid = _valid_indices(lats, lons)
+    if len(valid) == 0:
+        return None
+    if np is not None:
+        lat_a = np.asarray(lats, dtype=np.float64)[valid]
+        lon_a = np.asarray(lons, dtype=np.float64)[valid]
+        return [float(lat_a.min()), float(lon_a.min()), float(lat_a.max()), float(lon_a.max())]
+    pts_lat = [lats[i] for i in valid]
+    pts_lon = [lons[i] for i in valid]
+    return [min(pts_lat), min(pts_lon), max(pts_lat), max(pts_lon)]
+
+
+def path_length_m(lats, lons):
+    """Longueur orthodromique (haversine) de la polyligne des points valides, en mètres."""
+    valid = _valid_indices(lats, lons)
+    if len(valid) < 2:
+        return 0.0
+    if np is not None:
+        lat_r = np.radians(np.asarray(lats, dtype=np.float64)[valid])
+        lon_r = np.radians(np.asarray(lons, dtype=np.float64)[valid])
+        dlat = np.diff(lat_r)
+        dlon = np.diff(lon_r)
+        h = np.sin(dlat / 2) ** 2 + np.cos(lat_r[:-1]) * np.cos(lat_r[1:]) * np.sin(dlon / 2) ** 2
+        return float(2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(h, 1.0))).sum())
+
+    total = 0.0
+    for a, b in zip(valid, valid[1:]):
+        lat1, lat2 = math.radians(lats[a]), math.radians(lats[b])
+        dlat = lat2 - lat1
+        dlon = math.radians(lons[b] - lons[a])
+        h = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
+        total += 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(h, 1.0)))
+    return total
+
+
+def _in_bbox_mask(lats, lons, bbox):
+    """Masque des points contenus dans bbox = (sud, ouest, nord, est)."""
+    south, west, north, east = bbox
+    if np is not None:
+        lat_a = np.asarray(lats, dtype=np.float64)
+        lon_a = np.asarray(lons, dtype=np.float64)
+        inside = (lat_a >= south) & (lat_a <= north)
+        if west <= east:
+            inside &= (lon_a >= west) & (lon_a <= east)
+        else:  # bbox à cheval sur l'antiméridien
+            inside &= (lon_a >= west) | (lon_a <= east)
+        return inside
+    if west <= east:
+        return [south <= lat <= north and west <= lon <= east for lat, lon in zip(lats, lons)]
+    return [south <= lat <= north and (lon >= west or lon <= east) for lat, lon in zip(lats, lons)]
+
+
+def bbox_runs(lats, lons, bbox):
+    """
+    Plages [début, fin] (inclusives) de points consécutifs visibles dans bbox.
+
+    Chaque plage est élargie d'un point de part et d'autre pour que les
+    tronçons qui sortent de la vue restent dessinés jusqu'au bord.
+    """
+    inside = _in_bbox_mask(lats, lons, bbox)
+    n = len(inside)
+    if np is not None:
+        if not inside.any():
+            return []
+        edges = np.diff(np.concatenate(([0], inside.astype(np.int8), [0])))
+        run_starts = np.flatnonzero(edges == 1)
+        run_ends = np.flatnonzero(edges == -1) - 1
+        pairs = zip(run_starts.tolist(), run_ends.tolist())
+    else:
+        pairs = []
+        start = None
+        for i, flag in enumerate(inside):
+            if flag and start is None:
+                start = i
+            elif not flag and start is not None:
+                pairs.append((start, i - 1))
+                start = None
+        if start is not None:
+            pairs.append((start, n - 1))
+
+    runs = []
+    for start, end in pairs:
+        start, end = max(start - 1, 0), min(end + 1, n - 1)
+        if runs and start <= runs[-1][1] + 1:
+            runs[-1][1] = end
+        else:
+            runs.append([start, end])
+    return runs
+
+
+def detail_indices(lats, lons, bbox, zoom, keep=None, max_points=MAX_DETAIL_POINTS,
+                   pixels=DEFAULT_PIXEL_TOLERANCE):
+    """
+    Plages de points simplifiés visibles dans bbox au zoom donné.
+
+    Retourne une liste de listes d'indices (une par tronçon visible), simplifiées
+    avec la tolérance d'un pixel à ce zoom (doublée si le total dépasse
+    max_points) ; les indices de `keep` situés dans un tronçon sont conservés.
+    """
+    south, _, north, _ = bbox
+    tolerance = zoom_tolerance_m(zoom, (south + north) / 2, pixels)
+    keep = sorted(keep) if keep else []
+    runs = bbox_runs(lats, lons, bbox)
+    extent = extent_m(lats, lons)
+
+    while True:
+        parts = []
+        for start, end in runs:
+            run_keep = [i - start for i in keep if start <= i <= end]
+            indices = simplify_indices(lats[start:end + 1], lons[start:end + 1], tolerance, keep=run_keep)
+            if indices:
+                parts.append([start + i for i in indices])
+        if sum(len(part) for part in parts) <= max_points or not 0 < tolerance < extent:
+            return parts
+        tolerance *= 2
+
+
+def coordinates(lats, lons, indices):
+    """Liste [[lat, lon], ...] arrondie, prête pour la sérialisation JSON."""
+    return [[round(lats[i], COORD_DECIMALS), round(lons[i], COORD_DECIMALS)] for i in indices]
+
+
+def parse_bbox(value):
+    """Décode un paramètre bbox "sud,ouest,nord,est" ; None s'il est invalide."""
+    try:
+        south, west, north, east = (float(v) for v in (value or "").split(","))
+    except ValueError:
+        return None
+    if not all(math.isfinite(v) for v in (south, west, north, east)) or south > north:
+        return None
+    # Leaflet peut renvoyer des longitudes hors [-180, 180] après plusieurs tours du monde
+    if east - west >= 360:
+        west, east = -180.0, 180.0
+    else:
+        west = (west + 180.0) % 360.0 - 180.0
+        east = (east + 180.0) % 360.0 - 180.0
+    return south, west, north, east
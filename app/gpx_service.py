@@ -6,18 +6,26 @@ Intègre l'API WorldTides.info pour le calcul des marées.
 import os
 import json
 import hashlib
-import time
+import math
+import mmap
+import struct
 import io
 import xml.etree.ElementTree as ET
-from datetime import datetime, timezone
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+from functools import lru_cache
 from decimal import Decimal, ROUND_HALF_UP
 from bisect import bisect_right
 from flask import current_app
 
+from . import process_pool, tide_cache, tide_client, tide_store
+from .exceptions import TideApiError
+
 try:
-    import requests
+    import numpy as np
 except ImportError:
-    requests = None
+    np = None
 
 
 # ========== Configuration ==========
@@ -26,18 +34,20 @@ DEFAULT_WORLDTIDES_URL = "https://www.worldtides.info/api/v3"
 DEFAULT_WORLDTIDES_STEP = 10  # minutes
 DEFAULT_WORLDTIDES_DATUM = "CD"  # Chart Datum
 
-# Cache mémoire pour éviter de relire le disque
-_memory_cache = {}
+# Sous-répertoire du niveau partagé du cache de séries (voir tide_cache)
+TIDE_SERIES_SUBDIR = "series"
 
+# Rapprochement des positions vers les cellules de marée déjà en cache
+DEFAULT_TIDE_SNAP_KM = 1.0
+_tide_snap_stats = {"lookups": 0, "reused": 0}
 
-# ========== Utilitaires ==========
+NAN = float("nan")
+_TIME_DECODE_BATCH = 4096  # dates décodées par lot (mémoire bornée par segment)
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
 
-def _detect_namespace(root):
-    """Détecte le namespace GPX depuis l'élément root."""
-    import re
-    m = re.match(r"\{.*\}", root.tag)
-    return m.group(0) if m else ""
 
+# ========== Utilitaires ==========
 
 def _find_first(elem, queries):
     """Trouve le premier élément correspondant aux queries."""
@@ -66,6 +76,90 @@ def _round_decimeter(x):
     return float(Decimal(x).quantize(Decimal("0.1"), rounding=ROUND_HALF_UP))
 
 
+def _round_decimeter_array(x):
+    """
+    Version vectorisée de _round_decimeter (arrondi half-up, éloigné de zéro).
+
+    Le calcul |x| * 10 peut décaler d'un ulp une valeur proche de ...5 : ces
+    quelques valeurs repassent par l'arrondi Decimal exact.
+    """
+    scaled = np.abs(x) * 10.0
+    whole = np.floor(scaled)
+    frac = scaled - whole
+    rounded = np.copysign((whole + (frac >= 0.5)) / 10.0, x)
+
+    near_tie = np.abs(frac - 0.5) < 1e-6
+    if near_tie.any():
+        rounded[near_tie] = [_round_decimeter(v) for v in x[near_tie].tolist()]
+    return rounded
+
+
+# Au-delà, |x| * 10**décimales n'est plus représenté à mieux que 1e-4 près
+_FIXED_FORMAT_MAX_SCALED = 2.0 ** 40
+
+
+def _format_fixed_array(x, decimals):
+    """
+    Version vectorisée de [f"{v:.{decimals}f}" for v in x].
+
+    Retourne une matrice d'octets ASCII (une ligne par valeur, alignée à
+    droite, 0 = remplissage), ou None si une valeur est trop grande ou non
+    finie. Comme pour _round_decimeter_array, les valeurs proches d'une
+    demi-unité repassent par le formatage Python exact.
+    """
+    unit = 10 ** decimals
+    magnitude = np.abs(x)
+    scaled = magnitude * float(unit)
+    if len(x) and not scaled.max() < _FIXED_FORMAT_MAX_SCALED:
+        return None
+
+    whole = np.floor(scaled)
+    frac = scaled - whole
+    digits = (whole + (frac > 0.5)).astype(np.int64)
+    near_tie = np.abs(frac - 0.5) < 1e-4
+    if near_tie.any():
+        digits[near_tie] = [int(f"{v:.{decimals}f}".replace(".", "")) for v in magnitude[near_tie].tolist()]
+
+    int_part, frac_part = np.divmod(digits, unit)
+    int_width = len(str(int(int_part.max()))) if len(x) else 1
+    width = 1 + int_width + 1 + decimals   # signe, partie entière, point, décimales
+    out = np.zeros((len(x), width), dtype=np.uint8)
+
+    for col in range(width - 1, width - 1 - decimals, -1):
+        out[:, col] = 48 + frac_part % 10
+        frac_part //= 10
+    out[:, width - 1 - decimals] = ord(".")
+
+    # Partie entière sans zéros de tête (au moins un chiffre)
+    n_digits = np.ones(len(x), dtype=np.int64)
+    remaining = int_part.copy()
+    for j in range(int_width):
+        col = int_width - j
+        present = remaining > 0 if j else np.ones(len(x), dtype=bool)
+        out[present, col] = 48 + remaining[present] % 10
+        n_digits += present if j else 0
+        remaining //= 10
+
+    # Signe : f-string garde le '-' des valeurs négatives arrondies à zéro
+    negative = np.flatnonzero(np.signbit(x))
+    out[negative, int_width - n_digits[negative]] = ord("-")
+    return out
+
+
+def _format_xyz_lines(lats, lons, sondes):
+    """
+    Version vectorisée de "".join(f"{lat:.8f} {lon:.8f} {sonde:.2f}\\n" ...),
+    encodée en octets ; None si une colonne ne peut pas être formatée en bloc.
+    """
+    columns = [_format_fixed_array(lats, 8), _format_fixed_array(lons, 8), _format_fixed_array(sondes, 2)]
+    if any(column is None for column in columns):
+        return None
+    space = np.full((len(lats), 1), ord(" "), dtype=np.uint8)
+    newline = np.full((len(lats), 1), ord("\n"), dtype=np.uint8)
+    lines = np.hstack([columns[0], space, columns[1], space, columns[2], newline]).ravel()
+    return lines[lines != 0].tobytes()
+
+
 def _median(vals):
     """Calcule la médiane d'une liste."""
     if not vals:
@@ -126,54 +220,107 @@ def _cache_key(params_dict):
     return hashlib.sha256(blob.encode("utf-8")).hexdigest()
 
 
-def _cache_path(cache_dir, key):
-    """Retourne le chemin du fichier cache."""
-    os.makedirs(cache_dir, exist_ok=True)
-    return os.path.join(cache_dir, f"{key}.json")
+def _tide_cell(norm):
+    """Cellule du tide store : paramètres de la série hors intervalle de temps."""
+    return {k: norm[k] for k in ("url", "lat", "lon", "step", "datum")}
 
 
-def _cache_load(cache_dir, key, ttl_hours):
-    """Charge le cache depuis le disque."""
-    path = _cache_path(cache_dir, key)
-    if not os.path.exists(path):
-        return None
+def _parse_heights_payload(data):
+    """Extrait [(epoch, hauteur)] d'une réponse WorldTides (plusieurs formats de date)."""
+    samples = []
+    for it in (data or {}).get("heights") or []:
+        # Parse timestamp (plusieurs formats possibles)
+        if "dt" in it:
+            t = int(it["dt"])
+        elif "time" in it:
+            t = int(it["time"])
+            if t > 10**12:  # milliseconds
+                t //= 1000
+        elif "date" in it:
+            try:
+                t = _parse_iso8601_z(it["date"].replace(" ", "T") + "Z").timestamp()
+            except Exception:
+                continue
+        else:
+            continue
+        
+        try:
+            h = float(it.get("height"))
+        except (ValueError, TypeError):
+            continue
+        
+        samples.append((t, h))
+    return samples
+
+
+def _request_worldtides(norm, start, end, api_key):
+    """Appelle l'API WorldTides pour [start, end] et retourne [(epoch, hauteur)]."""
+    params = {
+        "heights": "",
+        "lat": f"{norm['lat']:.6f}",
+        "lon": f"{norm['lon']:.6f}",
+        "start": start,
+        "length": max(0, end - start),
+        "step": norm["step"],
+        "datum": norm["datum"],
+        "key": api_key
+    }
     
-    # Vérification TTL
-    if ttl_hours and ttl_hours > 0:
-        age = time.time() - os.path.getmtime(path)
-        if age > ttl_hours * 3600:
-            return None
+    url = norm["url"] + "?" + "&".join(f"{k}={v}" for k, v in params.items())
+    current_app.logger.debug(f"WorldTides URL (key masked): {url.replace(api_key, '***')}")
     
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        current_app.logger.warning(f"Cache load failed for {key[:12]}: {e}")
-        return None
+        return _parse_heights_payload(tide_client.get_json(url, logger=current_app.logger))
+    except TideApiError as e:
+        # Le message peut contenir l'URL : la clé API ne doit apparaître ni dans les logs ni à l'écran
+        message = str(e).replace(api_key, "***")
+        current_app.logger.error(f"WorldTides API error: {message}")
+        raise type(e)(message) from None
 
 
-def _cache_save(cache_dir, key, data):
-    """Sauvegarde les données dans le cache."""
-    path = _cache_path(cache_dir, key)
-    try:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f)
-    except Exception as e:
-        current_app.logger.warning(f"Cache save failed for {key[:12]}: {e}")
+def _snap_to_cached_cell(db, norm, snap_km):
+    """Remplace la position de norm par celle de la cellule en cache la plus proche (si dans la tolérance)."""
+    _tide_snap_stats["lookups"] += 1
+    nearby = tide_store.find_nearby_cell(db, _tide_cell(norm), snap_km)
+    if nearby is not None:
+        cell, dist = nearby
+        _tide_snap_stats["reused"] += 1
+        norm = dict(norm, lat=cell["lat"], lon=cell["lon"])
+        outcome = f"réutilisée à {dist:.2f} km"
+    else:
+        outcome = "nouvelle"
+    reused, lookups = _tide_snap_stats["reused"], _tide_snap_stats["lookups"]
+    current_app.logger.info(
+        f"WorldTides cellule {outcome} "
+        f"(réutilisation {reused}/{lookups} = {100.0 * reused / lookups:.0f}%)"
+    )
+    return norm
+
+
+def _tide_cache_summary():
+    """Compteurs du cache de séries pour les logs."""
+    st = tide_cache.stats
+    entries, size = tide_cache.memory_usage()
+    return (f"hits={st['hits']}, shared_hits={st['shared_hits']}, misses={st['misses']}, "
+            f"evictions={st['evictions']}, {entries} séries / {size / 1024:.0f} KB")
 
 
 # ========== API WorldTides ==========
 
 def fetch_worldtides_heights(lat, lon, start_dt, end_dt, api_key,
                              cache_dir=None, url_base=None, step_min=None,
-                             datum=None, ttl_hours=0.0):
+                             datum=None, ttl_hours=0.0, snap_km=0.0):
     """
     Récupère les hauteurs de marée depuis WorldTides avec cache.
     
-    Retourne: (times[], heights[]) où times est une liste de datetime
-              et heights une liste de floats (hauteurs en mètres).
+    Le cache disque (tide_store) couvre des intervalles par cellule : seuls les
+    sous-intervalles manquants sont demandés à l'API. Avec snap_km > 0, une
+    position à moins de snap_km d'une cellule déjà en cache réutilise sa série.
+    
+    Retourne: (epochs, heights), deux array('d') triés : instants en secondes
+              epoch UTC et hauteurs en mètres.
     """
-    if requests is None:
+    if tide_client.requests is None:
         raise ImportError("La bibliothèque 'requests' est requise pour WorldTides")
     
     if not api_key:
@@ -185,186 +332,320 @@ def fetch_worldtides_heights(lat, lon, start_dt, end_dt, api_key,
     
     # Normalisation des paramètres
     norm = _norm_params_for_key(url_base, lat, lon, start_dt, end_dt, step_min, datum)
+    if cache_dir and snap_km:
+        norm = _snap_to_cached_cell(tide_store.db_path(cache_dir), norm, snap_km)
     key = _cache_key(norm)
+    start, end = norm["start"], norm["end"]
     
-    # Vérification cache mémoire
-    if key in _memory_cache:
-        current_app.logger.debug(f"WorldTides cache mémoire HIT: {key[:12]}")
-        data = _memory_cache[key]
-    else:
-        data = None
-        # Vérification cache disque
-        if cache_dir:
-            data = _cache_load(cache_dir, key, ttl_hours)
-            if data:
-                current_app.logger.debug(f"WorldTides cache disque HIT: {key[:12]}")
-        
-        # Cache MISS - requête API
-        if data is None:
-            current_app.logger.info(f"WorldTides cache MISS - requête API")
-            start = norm["start"]
-            end = norm["end"]
-            length = max(0, end - start)
-            
-            params = {
-                "heights": "",
-                "lat": f"{norm['lat']:.6f}",
-                "lon": f"{norm['lon']:.6f}",
-                "start": start,
-                "length": length,
-                "step": norm["step"],
-                "datum": norm["datum"],
-                "key": api_key
-            }
-            
-            url = norm["url"] + "?" + "&".join(f"{k}={v}" for k, v in params.items())
-            current_app.logger.debug(f"WorldTides URL (key masked): {url.replace(api_key, '***')}")
-            
-            try:
-                r = requests.get(url, timeout=20)
-                r.raise_for_status()
-                data = r.json()
-                
-                # Sauvegarde dans les caches
-                _memory_cache[key] = data
-                if cache_dir:
-                    _cache_save(cache_dir, key, data)
-                    
-            except requests.RequestException as e:
-                current_app.logger.error(f"WorldTides API error: {e}")
-                raise RuntimeError(f"Erreur lors de l'appel à WorldTides: {e}")
+    # Vérification cache des séries décodées (mémoire puis fichiers partagés)
+    shared_dir = os.path.join(cache_dir, TIDE_SERIES_SUBDIR) if cache_dir else None
+    cached = tide_cache.get(key, shared_dir)
+    if cached is not None:
+        current_app.logger.debug(f"WorldTides cache série HIT: {key[:12]} ({_tide_cache_summary()})")
+        return cached
     
-    # Extraction des données
-    heights_arr = (data or {}).get("heights") or []
-    times, heights = [], []
-    
-    for it in heights_arr:
-        # Parse timestamp (plusieurs formats possibles)
-        if "dt" in it:
-            t = datetime.fromtimestamp(int(it["dt"]), tz=timezone.utc)
-        elif "time" in it:
-            val = int(it["time"])
-            if val > 10**12:  # milliseconds
-                val //= 1000
-            t = datetime.fromtimestamp(val, tz=timezone.utc)
-        elif "date" in it:
-            try:
-                t = _parse_iso8601_z(it["date"].replace(" ", "T") + "Z")
-            except Exception:
-                continue
+    if cache_dir:
+        db = tide_store.db_path(cache_dir)
+        cell = _tide_cell(norm)
+        gaps = tide_store.missing_ranges(db, cell, start, end, ttl_hours)
+        if gaps:
+            # Single-flight : un seul worker interroge l'API pour la cellule,
+            # les autres attendent puis relisent la couverture
+            with tide_store.cell_lock(db, cell) as waited:
+                if waited is None:
+                    current_app.logger.warning(f"WorldTides: verrou indisponible pour {key[:12]}, appel sans attente")
+                gaps = tide_store.missing_ranges(db, cell, start, end, ttl_hours)
+                if waited and waited >= 0.1:
+                    current_app.logger.info(
+                        f"WorldTides: attente {waited:.1f} s d'un appel concurrent, "
+                        f"{len(gaps)} plage(s) encore manquante(s)"
+                    )
+                for gap_start, gap_end in gaps:
+                    current_app.logger.info(
+                        f"WorldTides cache MISS - requête API ({gap_end - gap_start} s sur {end - start} s)"
+                    )
+                    samples = _request_worldtides(norm, gap_start, gap_end, api_key)
+                    tide_store.store_samples(db, cell, gap_start, gap_end, samples, ttl_hours)
         else:
-            continue
-        
-        try:
-            h = float(it.get("height"))
-        except (ValueError, TypeError):
-            continue
-        
-        times.append(t)
-        heights.append(h)
+            current_app.logger.debug(f"WorldTides cache disque HIT: {key[:12]}")
+        epochs, heights = tide_store.load_samples(db, cell, start, end, ttl_hours)
+    else:
+        current_app.logger.info(f"WorldTides cache MISS - requête API")
+        samples = sorted(_request_worldtides(norm, start, end, api_key), key=lambda x: x[0])
+        epochs = array('d', (t for t, _ in samples))
+        heights = array('d', (h for _, h in samples))
     
-    if len(times) < 2:
+    if len(epochs) < 2:
         raise ValueError("WorldTides: série insuffisante (<2 points)")
     
-    # Tri par timestamp
-    zipped = sorted(zip(times, heights), key=lambda x: x[0])
-    return [t for t, _ in zipped], [h for _, h in zipped]
+    try:
+        tide_cache.put(key, epochs, heights, shared_dir, logger=current_app.logger)
+    except OSError as e:
+        current_app.logger.warning(f"Tide series cache save failed for {key[:12]}: {e}")
+    current_app.logger.debug(f"WorldTides cache série MISS: {key[:12]} ({_tide_cache_summary()})")
+    return epochs, heights
+
+
+def _seconds_to_us(t):
+    """Secondes epoch -> microsecondes entières (arrondi comme datetime.fromtimestamp)."""
+    return round(t * 1_000_000)
 
 
 def interpolate_tide_height(t, times, heights):
-    """Interpole la hauteur de marée à un instant t."""
+    """
+    Interpole la hauteur de marée à l'instant t (secondes epoch).
+    
+    Les écarts sont calculés en microsecondes entières, comme avec des datetime.
+    """
     idx = bisect_right(times, t)
     if idx == 0 or idx == len(times):
         return None  # Hors plage
     
-    t0, t1 = times[idx - 1], times[idx]
+    t_us = _seconds_to_us(t)
+    t0, t1 = _seconds_to_us(times[idx - 1]), _seconds_to_us(times[idx])
     h0, h1 = heights[idx - 1], heights[idx]
-    dt = (t1 - t0).total_seconds()
+    dt = (t1 - t0) / 1_000_000
     
     if dt <= 0:
         return h0
     
-    a = (t - t0).total_seconds() / dt
+    a = ((t_us - t0) / 1_000_000) / dt
     return h0 + a * (h1 - h0)
 
 
 # ========== Parsing GPX ==========
 
-def _get_trksegs(trk, ns):
-    """Extrait les segments d'une track GPX."""
-    segs = trk.findall(f"{ns}trkseg") or trk.findall("trkseg")
-    if not segs:
-        # Pas de segments explicites - tous les points
-        pts = trk.findall(f".//{ns}trkpt") or trk.findall(".//trkpt")
-        return [pts]
-    
-    segments = []
-    for seg in segs:
-        pts = seg.findall(f"{ns}trkpt") or seg.findall("trkpt")
-        if not pts:
-            pts = seg.findall(f".//{ns}trkpt") or seg.findall(".//trkpt")
-        segments.append(pts)
-    
-    return segments
+def _local_name(tag):
+    """Nom local d'un tag ElementTree ('{ns}trkpt' -> 'trkpt')."""
+    return tag.rsplit("}", 1)[-1]
+
+
+@lru_cache(maxsize=4096)
+def _epoch_days(date_code):
+    """YYYYMMDD (entier) -> jours depuis 1970-01-01 ; mémoïsé, une trace couvre peu de jours."""
+    return date(date_code // 10000, date_code // 100 % 100, date_code % 100).toordinal() - _EPOCH_ORDINAL
+
+
+# Dispositions fixes décodées en bloc :
+# longueur -> (position du point décimal, chiffres de fraction, 'Z' final)
+_ISO_FIXED_LAYOUTS = {
+    19: (None, 0, False),
+    20: (None, 0, True),
+    23: (19, 3, False),
+    24: (19, 3, True),
+    26: (19, 6, False),
+    27: (19, 6, True),
+}
+_ISO_SEPARATORS = {4: ord("-"), 7: ord("-"), 10: ord("T"), 13: ord(":"), 16: ord(":")}
 
 
-def get_segment_stats(seg_pts, ns):
+def _digits_value(block, start, width):
+    """Valeur entière de `width` chiffres ASCII à partir de la colonne `start`."""
+    value = np.zeros(len(block), dtype=np.int64)
+    for col in range(start, start + width):
+        value = value * 10 + (block[:, col] - 48)
+    return value
+
+
+def _decode_fixed_layout(texts, length):
     """
-    Calcule les statistiques d'un segment.
-    Retourne: (total, valid, tmin, tmax, lat_median, lon_median)
+    Décode vectoriellement des dates de même longueur au format
+    YYYY-MM-DDTHH:MM:SS[.fff|.ffffff][Z].
+
+    L'epoch est calculé en microsecondes entières puis divisé une seule fois,
+    comme datetime.timestamp() : résultat identique au chemin général.
+    Retourne (epochs, ok) ; les lignes non conformes (ok False) sont à décoder
+    par le chemin général.
     """
-    total = len(seg_pts)
-    nvalid = 0
-    times = []
-    lats = []
-    lons = []
-    
-    for tp in seg_pts:
-        lat = tp.get("lat")
-        lon = tp.get("lon")
-        time_el = _find_first(tp, [f"{ns}time", ".//{*}time"])
-        ext_el = _find_first(tp, [f"{ns}extensions", ".//{*}extensions"])
-        depth_el = ext_el.find(".//{*}depth") if ext_el is not None else None
-        
-        time_txt = _text_or_none(time_el)
-        depth_txt = _text_or_none(depth_el)
-        
-        if time_txt and depth_txt and lat and lon:
-            nvalid += 1
-        
-        if time_txt:
-            try:
-                times.append(_parse_iso8601_z(time_txt))
-            except Exception:
-                pass
-        
-        if lat:
-            try:
-                lats.append(float(lat))
-            except Exception:
-                pass
-        
-        if lon:
+    dot, frac_digits, has_z = _ISO_FIXED_LAYOUTS[length]
+    block = np.frombuffer("".join(texts).encode("ascii"), dtype=np.uint8).reshape(-1, length)
+
+    ok = np.ones(len(block), dtype=bool)
+    for col, sep in _ISO_SEPARATORS.items():
+        ok &= block[:, col] == sep
+    if dot is not None:
+        ok &= block[:, dot] == ord(".")
+    if has_z:
+        ok &= block[:, -1] == ord("Z")
+    digit_cols = [c for c in range(19 + (frac_digits and frac_digits + 1)) if c not in _ISO_SEPARATORS and c != dot]
+    digits = block[:, digit_cols]
+    ok &= ((digits >= 48) & (digits <= 57)).all(axis=1)
+
+    hh = _digits_value(block, 11, 2)
+    mm = _digits_value(block, 14, 2)
+    ss = _digits_value(block, 17, 2)
+    ok &= (hh <= 23) & (mm <= 59) & (ss <= 59)
+    micros = _digits_value(block, 20, frac_digits) * 10 ** (6 - frac_digits) if frac_digits else 0
+
+    # Partie date : décodée une fois par jour distinct
+    date_codes = _digits_value(block, 0, 4) * 10000 + _digits_value(block, 5, 2) * 100 + _digits_value(block, 8, 2)
+    unique_codes, inverse = np.unique(date_codes, return_inverse=True)
+    unique_days = np.zeros(len(unique_codes), dtype=np.int64)
+    unique_ok = np.ones(len(unique_codes), dtype=bool)
+    for i, code in enumerate(unique_codes.tolist()):
+        try:
+            unique_days[i] = _epoch_days(code)
+        except ValueError:
+            unique_ok[i] = False
+    ok &= unique_ok[inverse]
+
+    total_us = (((unique_days[inverse] * 24 + hh) * 60 + mm) * 60 + ss) * 1_000_000 + micros
+    return total_us / 1_000_000, ok
+
+
+def _decode_iso8601_batch(texts):
+    """
+    Convertit une liste de dates ISO8601 (ou None) en array('d') de secondes
+    epoch UTC (NaN si absente/invalide).
+
+    Les formes fixes courantes sont décodées en bloc avec NumPy ; les autres
+    (fuseau explicite, autre précision, non ASCII...) passent par _iso8601_to_epoch.
+    """
+    texts = [txt or "" for txt in texts]
+    if np is None:
+        pending = [i for i, txt in enumerate(texts) if txt]
+        epochs = array('d', [NAN]) * len(texts)
+    else:
+        lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+        result = np.full(len(texts), NAN)
+        fallback = np.ones(len(texts), dtype=bool)
+        fallback[lengths == 0] = False
+        for length in _ISO_FIXED_LAYOUTS:
+            indices = np.flatnonzero(lengths == length)
+            if not len(indices):
+                continue
+            group = texts if len(indices) == len(texts) else [texts[i] for i in indices.tolist()]
             try:
-                lons.append(float(lon))
-            except Exception:
-                pass
-    
-    tmin = min(times) if times else None
-    tmax = max(times) if times else None
-    lat_median = _median(lats)
-    lon_median = _median(lons)
-    
-    return total, nvalid, tmin, tmax, lat_median, lon_median
+                values, ok = _decode_fixed_layout(group, length)
+            except UnicodeEncodeError:
+                continue
+            result[indices[ok]] = values[ok]
+            fallback[indices[ok]] = False
+        pending = np.flatnonzero(fallback).tolist()
+        epochs = array('d', result.tobytes())
+
+    for i in pending:
+        t = _iso8601_to_epoch(texts[i])
+        epochs[i] = NAN if t is None else t
+    return epochs
+
+
+def _iso8601_to_epoch(s):
+    """Convertit une date ISO8601 en secondes epoch UTC (None si invalide)."""
+    try:
+        dt = _parse_iso8601_z(s)
+    except Exception:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _epoch_to_datetime(t):
+    """Secondes epoch -> datetime UTC."""
+    return datetime.fromtimestamp(t, tz=timezone.utc)
+
+
+def _to_float(value):
+    """float(value), ou NaN si absent/invalide."""
+    if not value:
+        return NAN
+    try:
+        return float(value)
+    except ValueError:
+        return NAN
+
+
+def _new_segment_columns():
+    """Colonnes d'un segment en cours de lecture (une entrée par trkpt)."""
+    return {
+        'times': array('d'),   # secondes epoch UTC, NaN si absent/invalide
+        'time_texts': [],      # dates en attente de décodage par lot
+        'lats': array('d'),
+        'lons': array('d'),
+        'depths': array('d'),
+        'valid': 0,
+        'tmin': None,
+        'tmax': None,
+    }
+
+
+def _append_trkpt(columns, tp):
+    """Extrait (time, lat, lon, depth) d'un trkpt et met à jour les stats."""
+    tag = tp.tag
+    ns = tag[:tag.index("}") + 1] if tag.startswith("{") else ""
+    lat = tp.get("lat")
+    lon = tp.get("lon")
+    time_el = _find_first(tp, [f"{ns}time", ".//{*}time"])
+    ext_el = _find_first(tp, [f"{ns}extensions", ".//{*}extensions"])
+    depth_el = ext_el.find(".//{*}depth") if ext_el is not None else None
+
+    time_txt = _text_or_none(time_el)
+    depth_txt = _text_or_none(depth_el)
+
+    if time_txt and depth_txt and lat and lon:
+        columns['valid'] += 1
+
+    columns['time_texts'].append(time_txt)
+    if len(columns['time_texts']) >= _TIME_DECODE_BATCH:
+        _flush_times(columns)
+
+    columns['lats'].append(_to_float(lat))
+    columns['lons'].append(_to_float(lon))
+    columns['depths'].append(_to_float(depth_txt))
+
+
+def _flush_times(columns):
+    """Décode les dates en attente et met à jour tmin/tmax."""
+    texts = columns['time_texts']
+    if not texts:
+        return
+    epochs = _decode_iso8601_batch(texts)
+    columns['times'].extend(epochs)
+    texts.clear()
+
+    valid = [t for t in epochs if not math.isnan(t)]
+    if valid:
+        lo, hi = min(valid), max(valid)
+        if columns['tmin'] is None or lo < columns['tmin']:
+            columns['tmin'] = lo
+        if columns['tmax'] is None or hi > columns['tmax']:
+            columns['tmax'] = hi
+
+
+def _build_segment(columns, segment_id):
+    """Construit le dict segment final à partir des colonnes lues."""
+    _flush_times(columns)
+    lats = [v for v in columns['lats'] if not math.isnan(v)]
+    lons = [v for v in columns['lons'] if not math.isnan(v)]
+    return {
+        'segment_id': segment_id,
+        'times': columns['times'],
+        'lats': columns['lats'],
+        'lons': columns['lons'],
+        'depths': columns['depths'],
+        'total': len(columns['times']),
+        'valid': columns['valid'],
+        'tmin': _epoch_to_datetime(columns['tmin']) if columns['tmin'] is not None else None,
+        'tmax': _epoch_to_datetime(columns['tmax']) if columns['tmax'] is not None else None,
+        'lat_median': _median(lats),
+        'lon_median': _median(lons),
+    }
 
 
 def parse_gpx_file(file_stream):
     """
-    Parse un fichier GPX et retourne les segments avec leurs stats.
-    
+    Parse un fichier GPX en flux (iterparse) et retourne les segments avec leurs stats.
+
+    Chaque trkpt est converti en valeurs numériques puis libéré : la mémoire
+    reste proportionnelle au nombre de points et non à l'arbre XML.
+
     Retourne: liste de dict {
         'segment_id': int,
-        'points': list[Element],  # trkpt XML elements
+        'times': array('d'),   # epoch UTC, NaN si absent
+        'lats': array('d'),
+        'lons': array('d'),
+        'depths': array('d'),  # NaN si absent
         'total': int,
         'valid': int,
         'tmin': datetime,
@@ -373,124 +654,302 @@ def parse_gpx_file(file_stream):
         'lon_median': float
     }
     """
+    all_segments = []
+    segment_id = 1
+    found_track = False
+
+    open_elements = []   # pile des éléments ouverts (pour détacher les trkpt traités)
+    in_track = False
+    track_has_segments = False
+    track_columns = None    # points d'une <trk> sans <trkseg>
+    segment_columns = None  # <trkseg> en cours
+
+    def finish(columns):
+        nonlocal segment_id
+        if columns['valid'] == 0:
+            current_app.logger.debug(f"Segment {segment_id}: aucun point valide, ignoré")
+            return
+        all_segments.append(_build_segment(columns, segment_id))
+        segment_id += 1
+
     try:
-        tree = ET.parse(file_stream)
+        for event, elem in ET.iterparse(file_stream, events=("start", "end")):
+            name = _local_name(elem.tag)
+
+            if event == "start":
+                if name == "trk":
+                    found_track = True
+                    in_track = True
+                    track_has_segments = False
+                    track_columns = _new_segment_columns()
+                elif name == "trkseg" and in_track:
+                    track_has_segments = True
+                    segment_columns = _new_segment_columns()
+                open_elements.append(elem)
+                continue
+
+            open_elements.pop()
+            if name == "trkpt":
+                if in_track:
+                    _append_trkpt(segment_columns if segment_columns is not None else track_columns, elem)
+                elem.clear()
+                if open_elements:
+                    open_elements[-1].remove(elem)
+            elif name == "trkseg" and segment_columns is not None:
+                finish(segment_columns)
+                segment_columns = None
+                elem.clear()
+            elif name == "trk":
+                if not track_has_segments:
+                    # Pas de segments explicites - tous les points
+                    finish(track_columns)
+                track_columns = None
+                in_track = False
+                elem.clear()
     except ET.ParseError as e:
         raise ValueError(f"Erreur de parsing GPX: {e}")
-    
-    root = tree.getroot()
-    ns = _detect_namespace(root)
-    
-    tracks = root.findall(f".//{ns}trk") or root.findall(".//trk")
-    if not tracks:
+
+    if not found_track:
         raise ValueError("Aucune <trk> trouvée dans le GPX")
-    
-    all_segments = []
-    segment_id = 1
-    
-    for trk in tracks:
-        segments = _get_trksegs(trk, ns)
-        
-        for seg_pts in segments:
-            total, valid, tmin, tmax, lat_med, lon_med = get_segment_stats(seg_pts, ns)
-            
-            if valid == 0:
-                current_app.logger.debug(f"Segment {segment_id}: aucun point valide, ignoré")
-                continue
-            
-            all_segments.append({
-                'segment_id': segment_id,
-                'points': seg_pts,
-                'namespace': ns,
-                'total': total,
-                'valid': valid,
-                'tmin': tmin,
-                'tmax': tmax,
-                'lat_median': lat_med,
-                'lon_median': lon_med
-            })
-            
-            segment_id += 1
-    
+
     if not all_segments:
         raise ValueError("Aucun segment valide trouvé dans le GPX")
-    
+
     return all_segments
 
 
+# ========== Stockage des points (fichier binaire mappé) ==========
+#
+# <upload_id>.points : en-tête + table des segments + colonnes float64
+#   en-tête  : signature (8s), nb segments (I), réservé (I), nb points total (Q)
+#   table    : par segment -> segment_id (I), réservé (I), offset (Q), nb points (Q)
+#   données  : times[N], lats[N], lons[N], depths[N] (float64, ordre natif)
+# Un segment est la tranche [offset, offset + nb points) de chaque colonne ;
+# il est lu via mmap sans copie, et les workers partagent le page cache.
+#
+# <upload_id>.segments.json : statistiques de chaque segment
+
+# Colonnes stockées, dans l'ordre du fichier
+SEGMENT_COLUMNS = ('times', 'lats', 'lons', 'depths')
+_SEGMENT_STATS = ('segment_id', 'total', 'valid', 'lat_median', 'lon_median')
+
+_POINTS_MAGIC = b"GPXPTS01"
+_POINTS_HEADER = struct.Struct("<8sIIQ")
+_POINTS_ENTRY = struct.Struct("<IIQQ")
+
+
+def _segments_meta_path(upload_dir, upload_id):
+    return os.path.join(upload_dir, f"{upload_id}.segments.json")
+
+
+def _points_path(upload_dir, upload_id):
+    return os.path.join(upload_dir, f"{upload_id}.points")
+
+
+def save_segment_artifacts(upload_dir, upload_id, segments):
+    """Enregistre les segments parsés (points + statistiques) à côté du GPX uploadé."""
+    os.makedirs(upload_dir, exist_ok=True)
+    total_points = sum(len(seg['times']) for seg in segments)
+
+    with open(_points_path(upload_dir, upload_id), "wb") as f:
+        f.write(_POINTS_HEADER.pack(_POINTS_MAGIC, len(segments), 0, total_points))
+        offset = 0
+        for seg in segments:
+            count = len(seg['times'])
+            f.write(_POINTS_ENTRY.pack(seg['segment_id'], 0, offset, count))
+            offset += count
+        for column in SEGMENT_COLUMNS:
+            for seg in segments:
+                f.write(seg[column].tobytes())
+
+    meta = []
+    for seg in segments:
+        entry = {k: seg[k] for k in _SEGMENT_STATS}
+        entry['tmin'] = seg['tmin'].timestamp() if seg['tmin'] else None
+        entry['tmax'] = seg['tmax'].timestamp() if seg['tmax'] else None
+        meta.append(entry)
+
+    with open(_segments_meta_path(upload_dir, upload_id), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+def _segment_from_meta(entry):
+    """Statistiques d'un segment (sans les points) depuis l'index JSON."""
+    seg = {k: entry[k] for k in _SEGMENT_STATS}
+    seg['tmin'] = _epoch_to_datetime(entry['tmin']) if entry['tmin'] is not None else None
+    seg['tmax'] = _epoch_to_datetime(entry['tmax']) if entry['tmax'] is not None else None
+    return seg
+
+
+def load_segments_meta(upload_dir, upload_id):
+    """Retourne les statistiques de tous les segments d'un upload, ou None."""
+    path = _segments_meta_path(upload_dir, upload_id)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return [_segment_from_meta(entry) for entry in json.load(f)]
+
+
+def _map_points(upload_dir, upload_id):
+    """
+    Mappe le fichier de points en mémoire.
+
+    Retourne: ({segment_id: (offset, count)}, colonnes) où chaque colonne est
+    une memoryview float64 sur le fichier, ou None si le fichier est absent.
+    """
+    path = _points_path(upload_dir, upload_id)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, nb_segments, _, total_points = _POINTS_HEADER.unpack_from(mapped)
+    if magic != _POINTS_MAGIC:
+        raise ValueError(f"Fichier de points invalide: {path}")
+
+    index = {}
+    pos = _POINTS_HEADER.size
+    for _ in range(nb_segments):
+        segment_id, _, offset, count = _POINTS_ENTRY.unpack_from(mapped, pos)
+        index[segment_id] = (offset, count)
+        pos += _POINTS_ENTRY.size
+
+    values = memoryview(mapped)[pos:pos + 8 * len(SEGMENT_COLUMNS) * total_points].cast('d')
+    columns = [values[i * total_points:(i + 1) * total_points] for i in range(len(SEGMENT_COLUMNS))]
+    return index, columns
+
+
+def _attach_points(seg, index, columns):
+    """Ajoute au segment les vues (sans copie) sur ses colonnes."""
+    offset, count = index[seg['segment_id']]
+    for name, column in zip(SEGMENT_COLUMNS, columns):
+        seg[name] = column[offset:offset + count]
+    return seg
+
+
+def load_segments(upload_dir, upload_id):
+    """Charge tous les segments d'un upload (stats + colonnes mappées), ou None."""
+    meta = load_segments_meta(upload_dir, upload_id)
+    mapped = _map_points(upload_dir, upload_id)
+    if meta is None or mapped is None:
+        return None
+    index, columns = mapped
+    return [_attach_points(seg, index, columns) for seg in meta if seg['segment_id'] in index]
+
+
+def load_segment(upload_dir, upload_id, segment_id):
+    """Charge un seul segment (stats + colonnes mappées), ou None s'il est introuvable."""
+    meta = load_segments_meta(upload_dir, upload_id)
+    seg = next((s for s in meta or [] if s['segment_id'] == segment_id), None)
+    mapped = _map_points(upload_dir, upload_id) if seg is not None else None
+    if mapped is None or segment_id not in mapped[0]:
+        return None
+    return _attach_points(seg, *mapped)
+
+
 # ========== Génération fichiers ==========
 
 def _extract_rows_from_segment(segment, tide_data=None):
     """
     Extrait les lignes de données d'un segment avec correction marée optionnelle.
     
-    tide_data: tuple (times[], heights[]) ou None
+    tide_data: tuple (epochs[], heights[]) ou None
     
-    Retourne: list of tuples (time_txt, lat, lon, depth, sonde)
-              ou (time_txt, lat, lon, depth) si pas de marée
+    Retourne: list of tuples (time_epoch, lat, lon, depth, sonde)
+              ou (time_epoch, lat, lon, depth) si pas de marée
     """
-    seg_pts = segment['points']
-    ns = segment['namespace']
     rows = []
     
-    for tp in seg_pts:
-        lat = tp.get("lat")
-        lon = tp.get("lon")
-        time_el = _find_first(tp, [f"{ns}time", ".//{*}time"])
-        ext_el = _find_first(tp, [f"{ns}extensions", ".//{*}extensions"])
-        depth_el = ext_el.find(".//{*}depth") if ext_el is not None else None
-        
-        time_txt = _text_or_none(time_el)
-        depth_txt = _text_or_none(depth_el)
-        
-        if not (lat and lon and time_txt and depth_txt):
-            continue
-        
-        try:
-            lat_f = float(lat)
-            lon_f = float(lon)
-            depth_f = float(depth_txt)
-        except ValueError:
+    for t, lat_f, lon_f, depth_f in zip(segment['times'], segment['lats'], segment['lons'], segment['depths']):
+        if math.isnan(t) or math.isnan(lat_f) or math.isnan(lon_f) or math.isnan(depth_f):
             continue
         
         if tide_data is not None:
-            try:
-                t_dt = _parse_iso8601_z(time_txt)
-            except Exception:
-                continue
-            
-            h = interpolate_tide_height(t_dt, tide_data[0], tide_data[1])
+            h = interpolate_tide_height(t, tide_data[0], tide_data[1])
             if h is None:
                 continue  # Hors plage marée
             
             sonde_f = _round_decimeter(depth_f - h)
-            rows.append((time_txt, lat_f, lon_f, depth_f, sonde_f))
+            rows.append((t, lat_f, lon_f, depth_f, sonde_f))
         else:
-            rows.append((time_txt, lat_f, lon_f, depth_f))
+            rows.append((t, lat_f, lon_f, depth_f))
     
     # Tri par timestamp
-    rows.sort(key=lambda r: _parse_iso8601_z(r[0]))
+    rows.sort(key=lambda r: r[0])
     return rows
 
 
-def generate_xyz_file(segment, tide_data):
+def _compute_sondes_vectorized(segment, tide_data):
+    """
+    Calcule les sondes d'un segment entier avec NumPy.
+
+    Mêmes opérations flottantes, dans le même ordre, que interpolate_tide_height
+    et _round_decimeter : le résultat est identique au chemin point par point.
+    Les temps sont manipulés en microsecondes entières comme les timedelta.
+
+    Retourne: (times_epoch, lats, lons, sondes) triés par temps
+    """
+    times = np.frombuffer(segment['times'], dtype=np.float64)
+    lats = np.frombuffer(segment['lats'], dtype=np.float64)
+    lons = np.frombuffer(segment['lons'], dtype=np.float64)
+    depths = np.frombuffer(segment['depths'], dtype=np.float64)
+
+    keep = ~(np.isnan(times) | np.isnan(lats) | np.isnan(lons) | np.isnan(depths))
+    times, lats, lons, depths = times[keep], lats[keep], lons[keep], depths[keep]
+    t_us = np.rint(times * 1e6).astype(np.int64)
+
+    tide_us = np.rint(np.asarray(tide_data[0], dtype=np.float64) * 1e6).astype(np.int64)
+    tide_h = np.asarray(tide_data[1], dtype=np.float64)
+
+    # Indices comme bisect_right ; hors plage si idx == 0 ou idx == len
+    idx = np.searchsorted(tide_us, t_us, side="right")
+    in_range = (idx > 0) & (idx < len(tide_us))
+    idx = idx[in_range]
+    t_us, times, lats, lons, depths = t_us[in_range], times[in_range], lats[in_range], lons[in_range], depths[in_range]
+
+    t0, t1 = tide_us[idx - 1], tide_us[idx]
+    h0, h1 = tide_h[idx - 1], tide_h[idx]
+    dt = (t1 - t0).astype(np.float64) / 1e6
+    with np.errstate(divide="ignore", invalid="ignore"):
+        a = ((t_us - t0).astype(np.float64) / 1e6) / dt
+        heights = np.where(dt <= 0, h0, h0 + a * (h1 - h0))
+
+    sondes = _round_decimeter_array(depths - heights)
+
+    order = np.argsort(t_us, kind="stable")
+    return times[order], lats[order], lons[order], sondes[order]
+
+
+def generate_xyz_file(segment, tide_data, vectorized=True):
     """
     Génère un fichier XYZ pour un segment avec correction marée.
     
     Args:
         segment: dict du segment (de parse_gpx_file)
-        tide_data: tuple (times[], heights[])
+        tide_data: tuple (epochs[], heights[]) de fetch_worldtides_heights
+        vectorized: calcul NumPy sur tout le segment (si disponible)
     
     Retourne: (filename, BytesIO)
     """
-    rows = _extract_rows_from_segment(segment, tide_data)
-    
-    if not rows:
-        raise ValueError("Aucun point dans la plage de marée pour ce segment")
+    content = None
+    if vectorized and np is not None:
+        times, lats, lons, sondes = _compute_sondes_vectorized(segment, tide_data)
+        if not len(times):
+            raise ValueError("Aucun point dans la plage de marée pour ce segment")
+        first_t = float(times[0])
+        content = _format_xyz_lines(lats, lons, sondes)
+        if content is None:
+            rows = zip(lats.tolist(), lons.tolist(), sondes.tolist())
+    else:
+        full_rows = _extract_rows_from_segment(segment, tide_data)
+        if not full_rows:
+            raise ValueError("Aucun point dans la plage de marée pour ce segment")
+        first_t = full_rows[0][0]
+        rows = ((r[1], r[2], r[4]) for r in full_rows)
     
     # Générer le nom de fichier : YYYY-MM-DD_HHhMM_segNN_WT_sonde.xyz
-    first_time_txt = rows[0][0]
-    first_dt = _parse_iso8601_z(first_time_txt)
+    first_dt = _epoch_to_datetime(first_t)
     date_part = _name_stamp_no_seconds(first_dt)
     seg_part = f"seg{segment['segment_id']:02d}"
     src_part = "WT"  # WorldTides
@@ -498,11 +957,130 @@ def generate_xyz_file(segment, tide_data):
     filename = f"{date_part}_{seg_part}_{src_part}_{type_part}.xyz"
     
     # Générer le contenu XYZ (lat lon sonde)
-    output = io.BytesIO()
-    for r in rows:
-        lat, lon, sonde = r[1], r[2], r[4]
-        line = f"{lat:.8f} {lon:.8f} {sonde:.2f}\n"
-        output.write(line.encode('utf-8'))
-    
-    output.seek(0)
-    return filename, output
\ No newline at end of file
+    if content is None:
+        content = "".join(f"{lat:.8f} {lon:.8f} {sonde:.2f}\n" for lat, lon, sonde in rows).encode('utf-8')
+    output = io.BytesIO(content)
+    return filename, output
+
+# ========== Export groupé XYZ ==========
+
+DEFAULT_TIDE_FETCH_THREADS = 4
+BATCH_ERRORS_FILENAME = "ERREURS.txt"
+
+def render_stored_segment_xyz(upload_dir, upload_id, segment_id, tide_data):
+    """
+    Charge un segment enregistré et génère son fichier XYZ complet.
+
+    Exécutable dans un processus du pool (aucun contexte Flask requis).
+    Retourne: (filename, bytes)
+    """
+    segment = load_segment(upload_dir, upload_id, segment_id)
+    if segment is None:
+        raise ValueError(f"Segment {segment_id} introuvable.")
+    filename, output = generate_xyz_file(segment, tide_data)
+    return filename, output.getvalue()
+
+
+def _tide_request_key(segment, url_base=None, step_min=None, datum=None, **_):
+    """Clé de la série de marée d'un segment (segments identiques = un seul appel)."""
+    return _cache_key(_norm_params_for_key(
+        url_base or DEFAULT_WORLDTIDES_URL, segment['lat_median'], segment['lon_median'],
+        segment['tmin'], segment['tmax'],
+        step_min or DEFAULT_WORLDTIDES_STEP, datum or DEFAULT_WORLDTIDES_DATUM
+    ))
+
+
+def _fetch_tides_concurrently(app, segments, tide_params, threads):
+    """
+    Récupère les marées de plusieurs segments dans un pool de threads.
+
+    Les segments de même clé partagent une seule requête ; les appels d'une
+    même cellule restent sérialisés par le verrou du tide store.
+    Retourne: {segment_id: future}
+    """
+    def fetch(segment):
+        with app.app_context():
+            return fetch_worldtides_heights(
+                lat=segment['lat_median'],
+                lon=segment['lon_median'],
+                start_dt=segment['tmin'],
+                end_dt=segment['tmax'],
+                **tide_params
+            )
+
+    by_key = {}
+    futures = {}
+    executor = ThreadPoolExecutor(max_workers=max(1, threads))
+    for segment in segments:
+        key = _tide_request_key(segment, **tide_params)
+        if key not in by_key:
+            by_key[key] = executor.submit(fetch, segment)
+        futures[segment['segment_id']] = by_key[key]
+    executor.shutdown(wait=False)
+    current_app.logger.info(
+        f"XYZ batch: {len(by_key)} tide series for {len(segments)} segment(s)"
+    )
+    return futures
+
+
+def iter_xyz_batch_entries(upload_dir, upload_id, segment_ids, tide_params,
+                           tide_threads=DEFAULT_TIDE_FETCH_THREADS, max_workers=1):
+    """
+    Produit les entrées (nom, morceaux) d'un export XYZ groupé, dans l'ordre des segments.
+
+    Les marées sont récupérées en parallèle (threads, E/S réseau) puis chaque
+    XYZ est généré dans le pool de processus d'export si max_workers > 1 ; au plus
+    2 * max_workers fichiers sont en attente en mémoire. Les segments en échec
+    sont listés dans un fichier ERREURS.txt en fin d'archive.
+    """
+    meta = {seg['segment_id']: seg for seg in load_segments_meta(upload_dir, upload_id) or []}
+    errors = []
+    segments = []
+    for segment_id in segment_ids:
+        seg = meta.get(segment_id)
+        if seg is None:
+            errors.append(f"Segment {segment_id} : introuvable")
+        elif seg['tmin'] is None or seg['tmax'] is None:
+            errors.append(f"Segment {segment_id} : aucun horodatage valide")
+        else:
+            segments.append(seg)
+
+    tide_futures = _fetch_tides_concurrently(
+        current_app._get_current_object(), segments, tide_params, tide_threads
+    )
+    parallel = max_workers > 1 and len(segments) > 1
+
+    def render(segment_id):
+        tide_data = tide_futures[segment_id].result()
+        if not parallel:
+            return None, render_stored_segment_xyz(upload_dir, upload_id, segment_id, tide_data)
+        return process_pool.submit(process_pool.RENDER, render_stored_segment_xyz, upload_dir, upload_id, segment_id, tide_data), None
+
+    def collect(segment_id, future, result):
+        try:
+            return future.result() if future is not None else result
+        except (ValueError, RuntimeError) as e:
+            errors.append(f"Segment {segment_id} : {e}")
+            return None
+
+    pending = []
+    for seg in segments:
+        segment_id = seg['segment_id']
+        try:
+            future, result = render(segment_id)
+        except (ValueError, RuntimeError) as e:
+            errors.append(f"Segment {segment_id} : {e}")
+            continue
+        pending.append((segment_id, future, result))
+        while pending and (not parallel or len(pending) >= 2 * max_workers):
+            done = collect(*pending.pop(0))
+            if done is not None:
+                yield done[0], (done[1],)
+    for item in pending:
+        done = collect(*item)
+        if done is not None:
+            yield done[0], (done[1],)
+
+    if errors:
+        current_app.logger.warning(f"XYZ batch: {len(errors)} segment(s) failed")
+        yield BATCH_ERRORS_FILENAME, (("\n".join(errors) + "\n").encode("utf-8"),)
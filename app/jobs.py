@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Tâches de fond pour les conversions longues (gpx2xyz).
+
+Chaque tâche possède un répertoire cache/jobs/<job_id>/ contenant son état
+(job.json) puis son résultat. La requête web crée la tâche et rend la main ;
+le pool de processus des tâches du worker exécute la conversion (appel WorldTides compris)
+dans un contexte Flask minimal, et met à jour job.json au fil des étapes.
+
+Une tâche en cours rafraîchit updated_at (battement) tant qu'elle tourne ;
+une tâche en attente dépend du worker web qui l'a soumise (son pool meurt
+avec lui).
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from flask import Flask
+
+from . import gpx_service, process_pool
+
+JOB_FILENAME = "job.json"
+RESULT_FILENAME = "result"
+JOB_STALE_SECONDS = 15 * 60   # tâche en cours sans battement : considérée comme interrompue
+JOB_HEARTBEAT_SECONDS = 60
+JOB_MAX_AGE_SECONDS = 24 * 3600
+
+_JOB_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+_worker_app = None
+_state_lock = threading.Lock()   # battement et étapes écrivent job.json depuis le même processus
+
+
+def is_valid_job_id(job_id):
+    """Vérifie qu'un identifiant de tâche est un uuid hexadécimal (pas de chemin)."""
+    return bool(job_id) and bool(_JOB_ID_RE.match(job_id))
+
+
+def _job_dir(jobs_dir, job_id):
+    if not is_valid_job_id(job_id):
+        raise ValueError(f"Invalid job id: {job_id!r}")
+    return os.path.join(jobs_dir, job_id)
+
+
+def _write_state(job_dir, state):
+    """Écrit job.json de façon atomique."""
+    path = os.path.join(job_dir, JOB_FILENAME)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def _read_state(job_dir):
+    try:
+        with open(os.path.join(job_dir, JOB_FILENAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def create_job(jobs_dir, kind, params=None):
+    """Crée une tâche en attente et retourne son identifiant."""
+    job_id = uuid.uuid4().hex
+    job_dir = _job_dir(jobs_dir, job_id)
+    os.makedirs(job_dir)
+    now = time.time()
+    _write_state(job_dir, {
+        "job_id": job_id,
+        "kind": kind,
+        "params": params or {},
+        "status": "queued",
+        "progress": 0,
+        "message": "En attente",
+        "result_name": None,
+        "error": None,
+        "owner_pid": os.getpid(),
+        "created_at": now,
+        "started_at": None,
+        "updated_at": now,
+    })
+    return job_id
+
+
+def update_job(job_dir, **changes):
+    """Met à jour l'état d'une tâche (appelé depuis le processus de travail)."""
+    with _state_lock:
+        state = _read_state(job_dir) or {}
+        state.update(changes)
+        state["updated_at"] = time.time()
+        _write_state(job_dir, state)
+
+
+def _process_alive(pid):
+    """Le processus pid existe-t-il encore ? (dans le doute : oui)"""
+    if not pid or os.name != "posix":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def _is_interrupted(state):
+    """Tâche en cours sans battement récent, ou en attente dans un worker disparu."""
+    if state["status"] == "running":
+        return time.time() - state["updated_at"] > JOB_STALE_SECONDS
+    if state["status"] == "queued":
+        return not _process_alive(state.get("owner_pid"))
+    return False
+
+
+def get_job(jobs_dir, job_id):
+    """
+    État d'une tâche, ou None si elle n'existe pas.
+
+    Une tâche en cours sans battement depuis JOB_STALE_SECONDS (processus de
+    travail arrêté), ou en attente alors que le worker qui l'a soumise a
+    disparu, est signalée en erreur. L'attente derrière d'autres tâches du
+    pool n'est pas une interruption.
+    """
+    state = _read_state(_job_dir(jobs_dir, job_id))
+    if state is None:
+        return None
+    if _is_interrupted(state):
+        state = dict(state, status="error", error="La conversion a été interrompue. Veuillez relancer l'export.")
+    return state
+
+
+def result_path(jobs_dir, job_id):
+    """Chemin du fichier résultat d'une tâche terminée, ou None."""
+    state = get_job(jobs_dir, job_id)
+    if state is None or state["status"] != "done":
+        return None
+    path = os.path.join(_job_dir(jobs_dir, job_id), RESULT_FILENAME)
+    return path if os.path.exists(path) else None
+
+
+def cleanup_old_jobs(jobs_dir, max_age=JOB_MAX_AGE_SECONDS):
+    """Supprime les répertoires de tâches plus vieux que max_age."""
+    if not os.path.exists(jobs_dir):
+        return
+    now = time.time()
+    for entry in os.scandir(jobs_dir):
+        if entry.is_dir() and now - entry.stat().st_mtime > max_age:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+# ========== Exécution ==========
+
+def _get_worker_app():
+    """Application Flask minimale fournissant current_app (logger) aux services."""
+    global _worker_app
+    if _worker_app is None:
+        _worker_app = Flask("olex2rtz_jobs")
+        _worker_app.logger.setLevel(logging.INFO)
+    return _worker_app
+
+
+def _heartbeat(job_dir, stop):
+    """Rafraîchit updated_at pendant les étapes longues (appel WorldTides...)."""
+    while not stop.wait(JOB_HEARTBEAT_SECONDS):
+        update_job(job_dir)
+
+
+def run_gpx2xyz_job(job_dir, upload_dir, upload_id, segment_id, tide_params):
+    """Conversion XYZ d'un segment (exécutée dans un processus du pool)."""
+    app = _get_worker_app()
+    stop = threading.Event()
+    with app.app_context():
+        logger = app.logger
+        try:
+            update_job(job_dir, status="running", started_at=time.time(),
+                       progress=10, message="Chargement du segment")
+            threading.Thread(target=_heartbeat, args=(job_dir, stop), daemon=True).start()
+            segment = gpx_service.load_segment(upload_dir, upload_id, segment_id)
+            if not segment:
+                raise ValueError(f"Segment {segment_id} introuvable.")
+
+            update_job(job_dir, progress=30, message="Récupération des marées WorldTides")
+            logger.info(f"Fetching tide data for segment {segment_id}")
+            tide_data = gpx_service.fetch_worldtides_heights(
+                lat=segment['lat_median'],
+                lon=segment['lon_median'],
+                start_dt=segment['tmin'],
+                end_dt=segment['tmax'],
+                **tide_params
+            )
+
+            update_job(job_dir, progress=70, message="Génération du fichier XYZ")
+            logger.info(f"Generating XYZ file for segment {segment_id}")
+            filename, file_data = gpx_service.generate_xyz_file(segment=segment, tide_data=tide_data)
+
+            tmp_path = os.path.join(job_dir, f"{RESULT_FILENAME}.tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(file_data.getbuffer())
+            os.replace(tmp_path, os.path.join(job_dir, RESULT_FILENAME))
+
+            update_job(job_dir, status="done", progress=100, message="Terminé", result_name=filename)
+            logger.info(f"Successfully generated {filename}")
+        except (ValueError, RuntimeError) as e:
+            logger.warning(f"Conversion job failed for segment {segment_id}: {e}")
+            update_job(job_dir, status="error", error=str(e))
+        except Exception as e:
+            logger.error(f"Unexpected error during conversion job: {e}", exc_info=True)
+            update_job(job_dir, status="error", error="Erreur lors de la conversion. Veuillez réessayer.")
+        finally:
+            stop.set()
+
+
+def submit_gpx2xyz_job(jobs_dir, job_id, upload_dir, upload_id, segment_id, tide_params):
+    """Soumet la conversion d'un segment au pool de processus des tâches."""
+    job_dir = _job_dir(jobs_dir, job_id)
+    try:
+        process_pool.submit(process_pool.JOBS, run_gpx2xyz_job, job_dir, upload_dir, upload_id, segment_id, tide_params)
+    except Exception as e:
+        update_job(job_dir, status="error", error=f"Impossible de lancer la conversion: {e}")
+        raise
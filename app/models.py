@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Représentation compacte des routes.
+
+Une route stocke ses coordonnées en colonnes `array('d')` (8 octets par valeur),
+les noms de waypoints dans un index creux {position: nom} et ne calcule les
+chaînes d'affichage qu'à la demande.
+"""
+import json
+import struct
+from array import array
+
+# En-tête binaire : longueur du nom (octets), nombre de points, longueur des noms (octets)
+_HEADER = struct.Struct("<III")
+
+# Conteneur de plusieurs routes : signature + nombre de routes, puis (taille, route)*
+_PACK_MAGIC = b"ORT1"
+_PACK_COUNT = struct.Struct("<I")
+
+
+def _format_dm(value, positive, negative, width):
+    """Formate une coordonnée décimale en degrés/minutes (ex: 59° 52.123' N)."""
+    deg = abs(int(value))
+    minutes = (abs(value) - deg) * 60
+    direction = positive if value >= 0 else negative
+    return f"{deg:0{width}d}° {minutes:06.3f}' {direction}"
+
+
+class Waypoint:
+    """Vue légère sur un point d'une route (aucune donnée copiée)."""
+
+    __slots__ = ("route", "index")
+
+    def __init__(self, route, index):
+        self.route = route
+        self.index = index
+
+    @property
+    def lat(self):
+        return self.route.lats[self.index]
+
+    @property
+    def lon(self):
+        return self.route.lons[self.index]
+
+    @property
+    def timestamp(self):
+        return self.route.timestamps[self.index]
+
+    @property
+    def name(self):
+        return self.route.names.get(self.index, "")
+
+    @property
+    def lat_display(self):
+        return _format_dm(self.lat, "N", "S", 2)
+
+    @property
+    def lon_display(self):
+        return _format_dm(self.lon, "E", "W", 3)
+
+
+class Route:
+    """
+    Route en stockage colonne.
+
+    lats, lons : array('d') en degrés décimaux
+    timestamps : array('d') (NaN si inconnu, ex: import RTZ)
+    names      : dict {index: nom} pour les seuls waypoints nommés
+    """
+
+    __slots__ = ("route_name", "lats", "lons", "timestamps", "names")
+
+    def __init__(self, route_name, lats=None, lons=None, timestamps=None, names=None):
+        self.route_name = route_name
+        self.lats = lats if lats is not None else array("d")
+        self.lons = lons if lons is not None else array("d")
+        if timestamps is None:
+            timestamps = array("d", [float("nan")]) * len(self.lats)
+        self.timestamps = timestamps
+        self.names = names if names is not None else {}
+
+    def append(self, lat, lon, timestamp=float("nan"), name=""):
+        self.lats.append(lat)
+        self.lons.append(lon)
+        self.timestamps.append(timestamp)
+        if name:
+            self.names[len(self.lats) - 1] = name
+
+    def name_at(self, index):
+        return self.names.get(index, "")
+
+    def take(self, indices):
+        """Nouvelle route limitée aux waypoints `indices` (croissants), noms conservés."""
+        lats, lons, timestamps = self.lats, self.lons, self.timestamps
+        names = {}
+        for new_index, index in enumerate(indices):
+            if index in self.names:
+                names[new_index] = self.names[index]
+        return Route(
+            self.route_name,
+            array("d", [lats[i] for i in indices]),
+            array("d", [lons[i] for i in indices]),
+            array("d", [timestamps[i] for i in indices]),
+            names,
+        )
+
+    def __len__(self):
+        return len(self.lats)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.lats)
+        if not 0 <= index < len(self.lats):
+            raise IndexError("waypoint index out of range")
+        return Waypoint(self, index)
+
+    def __iter__(self):
+        for index in range(len(self.lats)):
+            yield Waypoint(self, index)
+
+    def __repr__(self):
+        return f"Route({self.route_name!r}, {len(self)} waypoints)"
+
+    # ----- Sérialisation binaire -----
+
+    def to_bytes(self):
+        """Sérialise la route dans un format binaire compact."""
+        name_bytes = self.route_name.encode("utf-8")
+        names_bytes = json.dumps(sorted(self.names.items()), separators=(",", ":")).encode("utf-8")
+        return b"".join((
+            _HEADER.pack(len(name_bytes), len(self.lats), len(names_bytes)),
+            name_bytes,
+            self.lats.tobytes(),
+            self.lons.tobytes(),
+            self.timestamps.tobytes(),
+            names_bytes,
+        ))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Reconstruit une route sérialisée par `to_bytes`."""
+        view = memoryview(data)
+        name_len, count, names_len = _HEADER.unpack_from(view)
+        offset = _HEADER.size
+        route_name = bytes(view[offset:offset + name_len]).decode("utf-8")
+        offset += name_len
+
+        columns = []
+        for _ in range(3):
+            column = array("d")
+            column.frombytes(view[offset:offset + count * column.itemsize])
+            offset += count * column.itemsize
+            columns.append(column)
+
+        names = {int(idx): name for idx, name in json.loads(bytes(view[offset:offset + names_len]).decode("utf-8"))}
+        return cls(route_name, columns[0], columns[1], columns[2], names)
+
+
+def pack_routes(routes):
+    """Sérialise une liste de routes dans un seul bloc binaire."""
+    parts = [_PACK_MAGIC, _PACK_COUNT.pack(len(routes))]
+    for route in routes:
+        data = route.to_bytes()
+        parts.append(_PACK_COUNT.pack(len(data)))
+        parts.append(data)
+    return b"".join(parts)
+
+
+def unpack_routes(data):
+    """Reconstruit la liste de routes sérialisée par `pack_routes`."""
+    view = memoryview(data)
+    if bytes(view[:len(_PACK_MAGIC)]) != _PACK_MAGIC:
+        raise ValueError("Invalid packed routes signature")
+    offset = len(_PACK_MAGIC)
+    (count,) = _PACK_COUNT.unpack_from(view, offset)
+    offset += _PACK_COUNT.size
+
+    routes = []
+    for _ in range(count):
+        (size,) = _PACK_COUNT.unpack_from(view, offset)
+        offset += _PACK_COUNT.size
+        routes.append(Route.from_bytes(view[offset:offset + size]))
+        offset += size
+    return routes
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Pools de processus par worker web.
+
+Deux pools nommés, créés au premier usage (pas dans le processus maître gunicorn) :
+- RENDER : exports groupés RTZ/GPX et XYZ, attendus par une réponse streamée ;
+- JOBS : tâches de fond gpx2xyz, longues, qui ne doivent pas occuper les
+  processus dont dépend un téléchargement en cours.
+
+Les processus sont lancés par un serveur "forkserver" et non par fork() du
+worker : un pool créé pendant que des threads (récupération des marées)
+tiennent des verrous ne peut pas hériter de verrous pris. Les processus ne
+partagent donc pas l'état du worker ; la configuration nécessaire (logging,
+caches, client WorldTides) leur est rejouée via configure(setup=...).
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+RENDER = "render"
+JOBS = "jobs"
+DEFAULT_WORKERS = 2
+START_METHOD = "forkserver"
+
+_pools = {}
+_sizes = {RENDER: DEFAULT_WORKERS, JOBS: DEFAULT_WORKERS}
+_setup = []    # (fonction, kwargs) exécutés au démarrage de chaque processus
+_lock = threading.Lock()
+
+
+def configure(render_workers=DEFAULT_WORKERS, job_workers=DEFAULT_WORKERS, setup=()):
+    """
+    Fixe la taille des pools et la configuration rejouée dans leurs processus
+    (appelé par create_app, avant tout usage). Les fonctions de `setup`
+    doivent être définies au niveau d'un module (sérialisées par pickle).
+    """
+    _sizes[RENDER] = max(1, int(render_workers))
+    _sizes[JOBS] = max(1, int(job_workers))
+    _setup[:] = list(setup)
+
+
+def size(name=RENDER):
+    """Nombre de processus du pool `name`."""
+    return _sizes[name]
+
+
+def _init_worker(setup):
+    """Initialisation d'un processus du pool."""
+    for func, kwargs in setup:
+        func(**kwargs)
+
+
+def get_pool(name=RENDER):
+    """Retourne le pool `name`, créé au premier usage."""
+    with _lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = ProcessPoolExecutor(
+                max_workers=_sizes[name],
+                mp_context=multiprocessing.get_context(START_METHOD),
+                initializer=_init_worker,
+                initargs=(list(_setup),),
+            )
+            _pools[name] = pool
+        return pool
+
+
+def _reset(name, broken):
+    """Remplace un pool cassé (processus mort, OOM...) au prochain get_pool()."""
+    with _lock:
+        if _pools.get(name) is broken:
+            del _pools[name]
+    broken.shutdown(wait=False)
+
+
+def submit(name, fn, *args, **kwargs):
+    """Soumet fn(*args) au pool `name` ; repart d'un pool neuf si le précédent est cassé."""
+    pool = get_pool(name)
+    try:
+        return pool.submit(fn, *args, **kwargs)
+    except BrokenProcessPool:
+        _reset(name, pool)
+        return get_pool(name).submit(fn, *args, **kwargs)
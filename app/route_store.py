@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Stockage des routes parsées côté serveur.
+
+Chaque upload (identifié par sa clé de contenu, voir `converter_service.upload_key`)
+possède un répertoire contenant un fichier binaire par route et un index JSON.
+L'index, calculé une fois à l'enregistrement, résume chaque route (emprise,
+longueur, nombre de points, période) et associe les noms aux identifiants :
+listes et sélections n'ont pas à relire les waypoints. La session ne conserve
+que l'identifiant d'upload ; une conversion ne relit que la route demandée.
+"""
+import json
+import math
+import os
+import re
+import shutil
+import uuid
+
+from . import geometry
+from .models import Route
+
+_UPLOAD_ID_RE = re.compile(r"^[0-9a-f]{64}$")
+INDEX_FILENAME = "index.json"
+INDEX_VERSION = 2  # à incrémenter si le contenu des résumés change
+
+
+def is_valid_upload_id(upload_id):
+    """Vérifie qu'un identifiant d'upload est une clé hexadécimale (pas de chemin)."""
+    return bool(upload_id) and bool(_UPLOAD_ID_RE.match(upload_id))
+
+
+def _upload_dir(store_dir, upload_id):
+    if not is_valid_upload_id(upload_id):
+        raise ValueError(f"Invalid upload id: {upload_id!r}")
+    return os.path.join(store_dir, upload_id)
+
+
+def _route_path(upload_dir, route_id):
+    return os.path.join(upload_dir, f"{int(route_id)}.route")
+
+
+def _first_last_timestamps(timestamps):
+    """Premier et dernier horodatage définis (secondes epoch), ou (None, None)."""
+    first = next((t for t in timestamps if not math.isnan(t)), None)
+    if first is None:
+        return None, None
+    last = next(t for t in reversed(timestamps) if not math.isnan(t))
+    return first, last
+
+
+def route_summary(route_id, route):
+    """Résumé d'une route pour l'index."""
+    start_time, end_time = _first_last_timestamps(route.timestamps)
+    return {
+        "route_id": route_id,
+        "route_name": route.route_name,
+        "count": len(route),
+        "bbox": geometry.bounds(route.lats, route.lons),
+        "length_m": round(geometry.path_length_m(route.lats, route.lons), 1),
+        "start_time": start_time,
+        "end_time": end_time,
+    }
+
+
+def _build_index(summaries):
+    by_name = {}
+    for summary in summaries:
+        # Noms en double : la première route l'emporte
+        by_name.setdefault(summary["route_name"], summary["route_id"])
+    return {"version": INDEX_VERSION, "routes": summaries, "by_name": by_name}
+
+
+def save_routes(store_dir, upload_id, routes):
+    """
+    Enregistre les routes d'un upload (un fichier par route + index).
+
+    Un upload identique déjà présent est réutilisé tel quel (sauf index d'une
+    version antérieure, reconstruit). L'écriture se fait dans un répertoire
+    temporaire renommé à la fin pour rester atomique entre workers.
+
+    Retourne l'index (voir `load_index`).
+    """
+    upload_dir = _upload_dir(store_dir, upload_id)
+    if os.path.exists(os.path.join(upload_dir, INDEX_FILENAME)):
+        index = load_index(store_dir, upload_id)
+        if index is not None:
+            # Rafraîchit la date pour le nettoyage par âge
+            os.utime(upload_dir)
+            return index
+        # Index d'une version antérieure : on écarte l'ancien répertoire
+        stale_dir = os.path.join(store_dir, f".{upload_id}.{uuid.uuid4().hex}.stale")
+        try:
+            os.rename(upload_dir, stale_dir)
+        except OSError:
+            pass
+        shutil.rmtree(stale_dir, ignore_errors=True)
+
+    os.makedirs(store_dir, exist_ok=True)
+    tmp_dir = os.path.join(store_dir, f".{upload_id}.{uuid.uuid4().hex}.tmp")
+    os.makedirs(tmp_dir)
+
+    summaries = []
+    try:
+        for route_id, route in enumerate(routes):
+            with open(_route_path(tmp_dir, route_id), "wb") as f:
+                f.write(route.to_bytes())
+            summaries.append(route_summary(route_id, route))
+
+        index = _build_index(summaries)
+        with open(os.path.join(tmp_dir, INDEX_FILENAME), "w", encoding="utf-8") as f:
+            json.dump(index, f)
+
+        try:
+            os.rename(tmp_dir, upload_dir)
+        except OSError:
+            # Un autre worker a enregistré le même upload entre-temps
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    return index
+
+
+def load_index(store_dir, upload_id):
+    """
+    Retourne l'index d'un upload, ou None (absent ou d'une version antérieure).
+
+    Index : {"version", "routes": [résumé par route], "by_name": {nom: route_id}}
+    où chaque résumé contient route_id, route_name, count, bbox
+    ([sud, ouest, nord, est] ou None), length_m, start_time et end_time
+    (secondes epoch ou None).
+    """
+    path = os.path.join(_upload_dir(store_dir, upload_id), INDEX_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    if not isinstance(index, dict) or index.get("version") != INDEX_VERSION:
+        return None
+    return index
+
+
+def load_route(store_dir, upload_id, route_id):
+    """Charge une seule route d'un upload, ou None si elle n'existe plus."""
+    path = _route_path(_upload_dir(store_dir, upload_id), route_id)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return Route.from_bytes(f.read())
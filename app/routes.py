@@ -1,37 +1,112 @@
-from flask import Blueprint, render_template, request, redirect, flash, url_for, session, send_file, current_app
+from flask import Blueprint, render_template, request, redirect, flash, url_for, session, send_file, current_app, Response, stream_with_context, jsonify, abort
 import json
 import gzip
-import io
 import os
+import unicodedata
 import uuid
+from urllib.parse import quote
 import xml.etree.ElementTree as ET
 from . import converter_service
+from . import geometry
 from . import gpx_service
+from . import jobs
+from . import process_pool
+from . import route_store
 from .exceptions import Olex2RtzError
 
-def _sample_waypoints(waypoints, max_count=100):
-    """Sample waypoints to limit display count while preserving first and last."""
-    if len(waypoints) <= max_count:
-        return waypoints
+UPLOAD_DATA_MAX_AGE = 24 * 3600  # cache navigateur des données d'un upload (immuables)
+WAYPOINT_PAGE_SIZE = 100      # lignes du tableau des waypoints par page
+WAYPOINT_PAGE_MAX = 1000
 
-    # Always keep first and last waypoints
-    sampled = [waypoints[0]]
+def _waypoint_page(route, offset, limit):
+    """Waypoints [offset, offset + limit) d'une route (vues, sans copie)."""
+    return [route[i] for i in range(offset, min(offset + limit, len(route)))]
 
-    # Calculate how many intermediate waypoints to sample
-    remaining_slots = max_count - 2  # -2 for first and last
-    total_intermediate = len(waypoints) - 2
+def _attachment_response(chunks, download_name, mimetype):
+    """Réponse streamée en pièce jointe (même Content-Disposition que send_file)."""
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    try:
+        download_name.encode("ascii")
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", download_name).encode("ascii", "ignore").decode("ascii")
+        quoted = quote(download_name, safe="!#$&+^`|~")
+        response.headers.set("Content-Disposition", "attachment", filename=simple, **{"filename*": f"UTF-8''{quoted}"})
+    else:
+        response.headers.set("Content-Disposition", "attachment", filename=download_name)
+    return response
+
+def _cache_subdir(name):
+    """Retourne le chemin d'un sous-répertoire du volume cache/."""
+    return os.path.join(current_app.root_path, "..", "cache", name)
+
+def _tide_params(api_key):
+    """Paramètres WorldTides communs passés à fetch_worldtides_heights."""
+    return {
+        "api_key": api_key,
+        "cache_dir": _cache_subdir("worldtides"),
+        "url_base": current_app.config.get("WORLDTIDES_URL"),
+        "snap_km": current_app.config.get("TIDE_SNAP_KM", gpx_service.DEFAULT_TIDE_SNAP_KM),
+    }
 
-    if remaining_slots > 0 and total_intermediate > 0:
-        step = max(1, total_intermediate // remaining_slots)
-        for i in range(1, total_intermediate + 1, step):
-            if len(sampled) < max_count - 1:  # -1 to leave room for last
-                sampled.append(waypoints[i])
+def _map_overview(lats, lons, keep=None):
+    """
+    Polyligne simplifiée d'une route ou d'un segment pour la vue d'ensemble.
+
+    Retourne un dict sérialisable : points conservés, leurs indices d'origine,
+    nombre total de points et tolérance appliquée (mètres).
+    """
+    indices, tolerance = geometry.simplify_overview(lats, lons, keep=keep)
+    return {
+        "points": geometry.coordinates(lats, lons, indices),
+        "indices": indices,
+        "count": len(lats),
+        "tolerance_m": tolerance,
+    }
 
-    # Always add the last waypoint
-    if len(waypoints) > 1:
-        sampled.append(waypoints[-1])
+def _map_detail(lats, lons, keep=None):
+    """Tronçons détaillés visibles pour les paramètres bbox et zoom de la requête."""
+    bbox = geometry.parse_bbox(request.args.get("bbox"))
+    zoom = request.args.get("zoom", type=int)
+    if bbox is None or zoom is None:
+        abort(400)
+    parts = geometry.detail_indices(lats, lons, bbox, zoom, keep=keep)
+    return {
+        "zoom": zoom,
+        "parts": [{"points": geometry.coordinates(lats, lons, part), "indices": part} for part in parts],
+    }
 
-    return sampled
+def _json_response(payload, etag=None, max_age=None):
+    """
+    Réponse JSON compacte, compressée en gzip si le client l'accepte.
+
+    Avec un ETag (faible : identique compressé ou non), la réponse peut être
+    mise en cache par le navigateur et revalidée par If-None-Match.
+    """
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    response = Response(mimetype="application/json")
+    if "gzip" in request.accept_encodings and len(body) > 1024:
+        body = gzip.compress(body, compresslevel=6)
+        response.headers["Content-Encoding"] = "gzip"
+    response.set_data(body)
+    response.vary.add("Accept-Encoding")
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+    if max_age is not None:
+        response.cache_control.private = True
+        response.cache_control.max_age = max_age
+    return response
+
+def _not_modified(etag, max_age=None):
+    """Réponse 304 si le client possède déjà la version `etag`, sinon None."""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag, weak=True)
+    response.vary.add("Accept-Encoding")
+    if max_age is not None:
+        response.cache_control.private = True
+        response.cache_control.max_age = max_age
+    return response
 
 main = Blueprint('main', __name__)
 
@@ -62,11 +137,18 @@ def upload():
 
     # Get processing options from form
     process_single_waypoints = request.form.get("process_single_waypoints") == "1"
-    limit_waypoint_table = request.form.get("limit_waypoint_table") == "1"
 
     try:
         current_app.logger.info(f"Processing uploaded file: {file.filename}")
-        routes = converter_service.process_uploaded_file(file, process_single_waypoints=process_single_waypoints)
+        upload_id = converter_service.upload_key(file, process_single_waypoints)
+        routes = converter_service.process_uploaded_file(
+            file,
+            process_single_waypoints=process_single_waypoints,
+            cache_dir=_cache_subdir("olex_routes"),
+            cache_max_bytes=current_app.config.get("PARSE_CACHE_MAX_BYTES"),
+            key=upload_id,
+        )
+        index = route_store.save_routes(_cache_subdir("routes"), upload_id, routes)
         current_app.logger.info(f"Successfully processed {file.filename}, found {len(routes)} routes.")
     except Olex2RtzError as e:
         current_app.logger.warning(f"A known error occurred during upload of {file.filename}: {e}")
@@ -77,40 +159,103 @@ def upload():
         flash("An unexpected internal error occurred. Please try again later.", "error")
         return redirect(url_for("main.index"))
 
-    session["routes"] = routes
+    # La session ne garde que l'identifiant d'upload ; les routes et leur index
+    # (noms, résumés) sont dans cache/routes/<upload_id>/
+    session.pop("routes", None)
+    session["route_upload_id"] = upload_id
 
-    # Create display routes with waypoint sampling if enabled
-    display_routes = routes
-    if limit_waypoint_table:
-        display_routes = []
-        for route in routes:
-            display_route = route.copy()
-            display_route["waypoints"] = _sample_waypoints(route["waypoints"])
-            display_routes.append(display_route)
+    # Tableaux des waypoints : première page seulement, la suite est chargée
+    # au défilement via /routes/<upload_id>/waypoints/<route_id>
+    display_routes = [
+        dict(summary, waypoints=_waypoint_page(route, 0, WAYPOINT_PAGE_SIZE))
+        for summary, route in zip(index["routes"], routes)
+    ]
 
     # Simple success message
     flash(f"{len(routes)} route{'s' if len(routes) != 1 else ''} successfully imported.", "success")
 
-    routes_js = {
-        r["route_name"]: [
-            {"lat": w["lat"], "lon": w["lon"], "name": w["name"]} for w in r["waypoints"]
-        ] for r in routes
-    }
-
     source_format = "gz" if file.filename.endswith(".gz") else "rtz"
     
     # Detect if there are single waypoint routes for styling purposes
-    has_single_waypoints = any(len(r.get('waypoints', [])) == 1 for r in routes)
+    has_single_waypoints = any(r["count"] == 1 for r in index["routes"])
 
     return render_template(
         "routes.html",
         routes=display_routes,
-        routes_js=routes_js,
+        upload_id=upload_id,
         source_format=source_format,
         has_single_waypoints=has_single_waypoints
     )
 
 
+@main.route("/routes/<upload_id>/geometry")
+def route_geometry(upload_id):
+    """
+    Géométrie simplifiée d'une route (?route=<route_id>), chargée par la carte
+    à la sélection. L'identifiant d'upload étant une clé de contenu, la réponse
+    est immuable et mise en cache côté navigateur.
+    """
+    route_id = request.args.get("route", type=int)
+    if route_id is None:
+        abort(400)
+    if not route_store.is_valid_upload_id(upload_id):
+        abort(404)
+
+    etag = f"{upload_id}-{route_id}-g{geometry.GEOMETRY_VERSION}"
+    not_modified = _not_modified(etag, UPLOAD_DATA_MAX_AGE)
+    if not_modified is not None:
+        return not_modified
+
+    route = route_store.load_route(_cache_subdir("routes"), upload_id, route_id)
+    if route is None:
+        abort(404)
+    payload = dict(
+        _map_overview(route.lats, route.lons, keep=list(route.names)),
+        route_id=route_id,
+        route_name=route.route_name,
+        names=route.names,
+    )
+    return _json_response(payload, etag, UPLOAD_DATA_MAX_AGE)
+
+@main.route("/routes/<upload_id>/waypoints/<int:route_id>")
+def route_waypoints(upload_id, route_id):
+    """
+    Page du tableau des waypoints d'une route (?offset=&limit=), en lignes HTML
+    rendues côté serveur, chargée au défilement du tableau.
+    """
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    limit = min(max(request.args.get("limit", WAYPOINT_PAGE_SIZE, type=int), 1), WAYPOINT_PAGE_MAX)
+    if not route_store.is_valid_upload_id(upload_id):
+        abort(404)
+
+    etag = f"{upload_id}-{route_id}-w{offset}-{limit}"
+    not_modified = _not_modified(etag, UPLOAD_DATA_MAX_AGE)
+    if not_modified is not None:
+        return not_modified
+
+    route = route_store.load_route(_cache_subdir("routes"), upload_id, route_id)
+    if route is None:
+        abort(404)
+    waypoints = _waypoint_page(route, offset, limit)
+    next_offset = offset + len(waypoints)
+    payload = {
+        "html": render_template("_waypoint_rows.html", waypoints=waypoints),
+        "offset": offset,
+        "next_offset": next_offset if next_offset < len(route) else None,
+        "total": len(route),
+    }
+    return _json_response(payload, etag, UPLOAD_DATA_MAX_AGE)
+
+@main.route("/routes/<upload_id>/detail/<int:route_id>")
+def route_detail(upload_id, route_id):
+    """Géométrie détaillée d'une route pour la vue courante de la carte (bbox, zoom)."""
+    if not route_store.is_valid_upload_id(upload_id):
+        abort(404)
+    route = route_store.load_route(_cache_subdir("routes"), upload_id, route_id)
+    if route is None:
+        abort(404)
+    return _json_response(_map_detail(route.lats, route.lons, keep=list(route.names)))
+
 @main.route("/contact", methods=["GET", "POST"])
 def contact():
     from .email_utils import send_contact_email
@@ -132,6 +277,21 @@ def contact():
     return render_template("contact.html")
 
 
+def _simplify_options():
+    """
+    Options de simplification du formulaire de conversion.
+
+    Retourne {} (pas de simplification), {"tolerance_m": ...} ou {"max_points": ...} ;
+    lève ValueError si la valeur saisie n'est pas un nombre.
+    """
+    mode = request.form.get("simplify", "")
+    value = request.form.get("simplify_value", "").strip().replace(",", ".")
+    if mode == "tolerance":
+        return {"tolerance_m": float(value)}
+    if mode == "count":
+        return {"max_points": int(value)}
+    return {}
+
 def _handle_conversion(generator_func, mimetype):
     """Gère la logique de conversion de route commune."""
     route_name = request.form.get("route")
@@ -141,26 +301,41 @@ def _handle_conversion(generator_func, mimetype):
         flash("No route selected.", "error")
         return redirect(url_for("main.index"))
 
-    stored_routes = session.get("routes")
-    if not stored_routes:
+    upload_id = session.get("route_upload_id")
+    if not upload_id:
         flash("No routes available for conversion. Please upload a file first.", "error")
         return redirect(url_for("main.index"))
 
+    store_dir = _cache_subdir("routes")
+    index = route_store.load_index(store_dir, upload_id)
+    if index is None:
+        flash("Uploaded routes have expired. Please upload the file again.", "error")
+        return redirect(url_for("main.index"))
+
+    selected_route = None
+    route_id = index["by_name"].get(route_name)
+    if route_id is not None:
+        selected_route = route_store.load_route(store_dir, upload_id, route_id)
+        if selected_route is None:
+            flash("Uploaded routes have expired. Please upload the file again.", "error")
+            return redirect(url_for("main.index"))
+
     try:
-        download_name, xml_data = generator_func(
-            stored_routes, route_name, new_name
-        )
+        simplify = _simplify_options()
+    except ValueError:
+        flash("Invalid simplification value.", "error")
+        return redirect(url_for("main.index"))
+
+    try:
+        if simplify:
+            selected_route = converter_service.simplify_route(selected_route, **simplify)
+        download_name, xml_chunks = generator_func(selected_route, new_name)
     except Olex2RtzError as e:
         current_app.logger.warning(f"A known error occurred during conversion for {route_name}: {e}")
         flash(str(e), "error")
         return redirect(url_for("main.index"))
 
-    return send_file(
-        xml_data,
-        as_attachment=True,
-        download_name=download_name,
-        mimetype=mimetype,
-    )
+    return _attachment_response(xml_chunks, download_name, mimetype)
 
 @main.route("/convert", methods=["POST"])
 def convert():
@@ -173,6 +348,48 @@ def convert_to_gpx():
     return _handle_conversion(converter_service.generate_gpx_file, "application/gpx+xml")
 
 
+@main.route("/convert-batch", methods=["POST"])
+def convert_batch():
+    """Exporte plusieurs routes (ou toutes) dans une archive ZIP streamée."""
+    selected_names = request.form.getlist("routes")
+    export_format = request.form.get("format", "rtz")
+    formats = ["rtz", "gpx"] if export_format == "both" else [export_format]
+
+    if any(fmt not in converter_service.EXPORT_FORMATS for fmt in formats):
+        flash("Unsupported export format.", "error")
+        return redirect(url_for("main.index"))
+
+    upload_id = session.get("route_upload_id")
+    if not upload_id:
+        flash("No routes available for conversion. Please upload a file first.", "error")
+        return redirect(url_for("main.index"))
+
+    store_dir = _cache_subdir("routes")
+    index = route_store.load_index(store_dir, upload_id)
+    if index is None:
+        flash("Uploaded routes have expired. Please upload the file again.", "error")
+        return redirect(url_for("main.index"))
+
+    # Aucune sélection = toutes les routes
+    if selected_names:
+        selected_names = set(selected_names)
+        route_ids = [r["route_id"] for r in index["routes"] if r["route_name"] in selected_names]
+    else:
+        route_ids = [r["route_id"] for r in index["routes"]]
+    if not route_ids:
+        flash("No route selected.", "error")
+        return redirect(url_for("main.index"))
+
+    # Pool de processus seulement pour les gros lots
+    max_workers = process_pool.size(process_pool.RENDER)
+    if len(route_ids) * len(formats) < current_app.config.get("BATCH_EXPORT_PARALLEL_MIN", 8):
+        max_workers = 1
+
+    current_app.logger.info(f"Batch export of {len(route_ids)} route(s) as {'+'.join(formats)} ({max_workers} worker(s))")
+    entries = converter_service.iter_batch_entries(store_dir, upload_id, route_ids, formats, max_workers=max_workers)
+    return _attachment_response(converter_service.iter_zip_archive(entries), "routes.zip", "application/zip")
+
+
 # ========== GPX2XYZ Routes (hidden tool) ==========
 
 @main.route("/tools/gpx2xyz")
@@ -206,7 +423,7 @@ def gpx2xyz_process_upload():
         flash("Erreur lors du traitement du fichier GPX.", "error")
         return redirect(url_for("main.gpx2xyz_upload"))
     
-    # Stocker les segments en session (sans les points XML pour éviter les problèmes de sérialisation)
+    # Stocker les segments en session (statistiques seulement)
     session_segments = []
     for seg in segments:
         session_segments.append({
@@ -221,18 +438,20 @@ def gpx2xyz_process_upload():
     
     session["gpx_segments"] = session_segments
     
-    # Stocker le fichier GPX sur disque avec un UUID unique (évite les problèmes de taille en session)
+    # Stocker le fichier GPX et les segments pré-parsés sur disque avec un UUID unique
+    # (évite les problèmes de taille en session et le re-parsing aux étapes suivantes)
     gpx_upload_id = str(uuid.uuid4())
-    temp_dir = os.path.join(current_app.root_path, "..", "cache", "gpx_uploads")
+    temp_dir = _cache_subdir("gpx_uploads")
     os.makedirs(temp_dir, exist_ok=True)
     
     temp_file_path = os.path.join(temp_dir, f"{gpx_upload_id}.gpx")
     file.seek(0)
     with open(temp_file_path, "wb") as f:
         f.write(file.read())
+    gpx_service.save_segment_artifacts(temp_dir, gpx_upload_id, segments)
     
     session["gpx_upload_id"] = gpx_upload_id
-    current_app.logger.info(f"Stored GPX file as {gpx_upload_id}.gpx")
+    current_app.logger.info(f"Stored GPX file and {len(segments)} segment(s) as {gpx_upload_id}")
     
     flash(f"{len(segments)} segment(s) trouvé(s) dans le fichier GPX.", "success")
     return redirect(url_for("main.gpx2xyz_segments"))
@@ -253,36 +472,27 @@ def gpx2xyz_segments():
         flash("Données GPX perdues. Veuillez re-uploader le fichier.", "error")
         return redirect(url_for("main.gpx2xyz_upload"))
     
-    temp_dir = os.path.join(current_app.root_path, "..", "cache", "gpx_uploads")
-    temp_file_path = os.path.join(temp_dir, f"{gpx_upload_id}.gpx")
-    
-    if not os.path.exists(temp_file_path):
-        flash("Fichier GPX expiré. Veuillez re-uploader le fichier.", "error")
-        return redirect(url_for("main.gpx2xyz_upload"))
+    temp_dir = _cache_subdir("gpx_uploads")
     
     try:
-        with open(temp_file_path, "rb") as f:
-            file_stream = io.BytesIO(f.read())
-        segments = gpx_service.parse_gpx_file(file_stream)
+        segments = gpx_service.load_segments(temp_dir, gpx_upload_id)
     except Exception as e:
-        current_app.logger.error(f"Error reparsing GPX for map: {e}")
+        current_app.logger.error(f"Error loading GPX segments for map: {e}")
         flash("Erreur lors de la lecture des données GPX.", "error")
         return redirect(url_for("main.gpx2xyz_upload"))
     
-    # Créer la structure JS pour la carte (tous les segments)
+    if segments is None:
+        flash("Fichier GPX expiré. Veuillez re-uploader le fichier.", "error")
+        return redirect(url_for("main.gpx2xyz_upload"))
+    
+    # Carte : polylignes simplifiées, le détail est demandé selon le zoom
     segments_js = {}
     for seg in segments:
         seg_name = f"Segment {seg['segment_id']}"
-        points = []
-        for pt in seg['points']:
-            lat = pt.get("lat")
-            lon = pt.get("lon")
-            if lat and lon:
-                try:
-                    points.append({"lat": float(lat), "lon": float(lon)})
-                except ValueError:
-                    continue
-        segments_js[seg_name] = points
+        segments_js[seg_name] = dict(
+            _map_overview(seg['lats'], seg['lons']),
+            segment_id=seg['segment_id'],
+        )
     
     return render_template(
         "gpx2xyz_segments.html",
@@ -291,6 +501,18 @@ def gpx2xyz_segments():
     )
 
 
+@main.route("/tools/gpx2xyz/segments/<int:segment_id>/detail")
+def gpx2xyz_segment_detail(segment_id):
+    """Géométrie détaillée d'un segment pour la vue courante de la carte (bbox, zoom)."""
+    gpx_upload_id = session.get("gpx_upload_id")
+    if not gpx_upload_id:
+        abort(404)
+    segment = gpx_service.load_segment(_cache_subdir("gpx_uploads"), gpx_upload_id, segment_id)
+    if segment is None:
+        abort(404)
+    return _json_response(_map_detail(segment['lats'], segment['lons']))
+
+
 @main.route("/tools/gpx2xyz/convert", methods=["POST"])
 def gpx2xyz_convert():
     """Convertit le segment sélectionné en XYZ avec correction marée."""
@@ -312,70 +534,127 @@ def gpx2xyz_convert():
         flash("Données GPX perdues. Veuillez re-uploader le fichier.", "error")
         return redirect(url_for("main.gpx2xyz_upload"))
     
-    temp_dir = os.path.join(current_app.root_path, "..", "cache", "gpx_uploads")
-    temp_file_path = os.path.join(temp_dir, f"{gpx_upload_id}.gpx")
+    temp_dir = _cache_subdir("gpx_uploads")
     
-    if not os.path.exists(temp_file_path):
+    segments_meta = gpx_service.load_segments_meta(temp_dir, gpx_upload_id)
+    if segments_meta is None:
         flash("Fichier GPX expiré. Veuillez re-uploader le fichier.", "error")
         return redirect(url_for("main.gpx2xyz_upload"))
     
-    try:
-        # Reparser le GPX
-        with open(temp_file_path, "rb") as f:
-            file_stream = io.BytesIO(f.read())
-        segments = gpx_service.parse_gpx_file(file_stream)
-        
-        # Trouver le segment demandé
-        segment = next((s for s in segments if s['segment_id'] == segment_id), None)
-        if not segment:
-            flash(f"Segment {segment_id} introuvable.", "error")
-            return redirect(url_for("main.gpx2xyz_segments"))
-        
-        # Récupérer la clé API WorldTides
-        api_key = current_app.config.get("WORLDTIDES_API_KEY")
-        if not api_key:
-            flash("Clé API WorldTides non configurée (WORLDTIDES_API_KEY).", "error")
-            return redirect(url_for("main.gpx2xyz_segments"))
-        
-        # Récupérer le cache dir
-        cache_dir = os.path.join(current_app.root_path, "..", "cache", "worldtides")
-        
-        # Récupérer les données de marée via WorldTides
-        current_app.logger.info(f"Fetching tide data for segment {segment_id}")
-        tide_data = gpx_service.fetch_worldtides_heights(
-            lat=segment['lat_median'],
-            lon=segment['lon_median'],
-            start_dt=segment['tmin'],
-            end_dt=segment['tmax'],
-            api_key=api_key,
-            cache_dir=cache_dir
-        )
-        
-        # Générer le fichier XYZ
-        current_app.logger.info(f"Generating XYZ file for segment {segment_id}")
-        filename, file_data = gpx_service.generate_xyz_file(
-            segment=segment,
-            tide_data=tide_data
-        )
-        
-        current_app.logger.info(f"Successfully generated {filename}")
-        
-        return send_file(
-            file_data,
-            as_attachment=True,
-            download_name=filename,
-            mimetype="text/plain"
-        )
-        
-    except ValueError as e:
-        current_app.logger.warning(f"Validation error during conversion: {e}")
-        flash(str(e), "error")
+    if not any(seg['segment_id'] == segment_id for seg in segments_meta):
+        flash(f"Segment {segment_id} introuvable.", "error")
         return redirect(url_for("main.gpx2xyz_segments"))
-    except RuntimeError as e:
-        current_app.logger.error(f"Runtime error during conversion: {e}")
-        flash(str(e), "error")
+    
+    # Récupérer la clé API WorldTides
+    api_key = current_app.config.get("WORLDTIDES_API_KEY")
+    if not api_key:
+        flash("Clé API WorldTides non configurée (WORLDTIDES_API_KEY).", "error")
         return redirect(url_for("main.gpx2xyz_segments"))
+    
+    # La conversion (marées + XYZ) s'exécute en tâche de fond : la requête rend la main
+    jobs_dir = _cache_subdir("jobs")
+    tide_params = _tide_params(api_key)
+    try:
+        job_id = jobs.create_job(jobs_dir, "gpx2xyz", {"upload_id": gpx_upload_id, "segment_id": segment_id})
+        jobs.submit_gpx2xyz_job(
+            jobs_dir, job_id, temp_dir, gpx_upload_id, segment_id, tide_params
+        )
     except Exception as e:
-        current_app.logger.error(f"Unexpected error during conversion: {e}", exc_info=True)
+        current_app.logger.error(f"Could not start conversion job: {e}", exc_info=True)
         flash("Erreur lors de la conversion. Veuillez réessayer.", "error")
-        return redirect(url_for("main.gpx2xyz_segments"))
\ No newline at end of file
+        return redirect(url_for("main.gpx2xyz_segments"))
+    
+    current_app.logger.info(f"Queued conversion job {job_id} for segment {segment_id}")
+    return redirect(url_for("main.gpx2xyz_job", job_id=job_id))
+
+
+@main.route("/tools/gpx2xyz/convert-batch", methods=["POST"])
+def gpx2xyz_convert_batch():
+    """Exporte plusieurs segments (ou tous) en XYZ dans une archive ZIP streamée."""
+    gpx_upload_id = session.get("gpx_upload_id")
+    if not gpx_upload_id:
+        flash("Données GPX perdues. Veuillez re-uploader le fichier.", "error")
+        return redirect(url_for("main.gpx2xyz_upload"))
+    
+    temp_dir = _cache_subdir("gpx_uploads")
+    segments_meta = gpx_service.load_segments_meta(temp_dir, gpx_upload_id)
+    if segments_meta is None:
+        flash("Fichier GPX expiré. Veuillez re-uploader le fichier.", "error")
+        return redirect(url_for("main.gpx2xyz_upload"))
+    
+    # Aucune sélection = tous les segments
+    try:
+        selected = {int(v) for v in request.form.getlist("segment_ids")}
+    except ValueError:
+        flash("ID de segment invalide.", "error")
+        return redirect(url_for("main.gpx2xyz_segments"))
+    segment_ids = [seg['segment_id'] for seg in segments_meta if not selected or seg['segment_id'] in selected]
+    if not segment_ids:
+        flash("Aucun segment sélectionné.", "error")
+        return redirect(url_for("main.gpx2xyz_segments"))
+    
+    api_key = current_app.config.get("WORLDTIDES_API_KEY")
+    if not api_key:
+        flash("Clé API WorldTides non configurée (WORLDTIDES_API_KEY).", "error")
+        return redirect(url_for("main.gpx2xyz_segments"))
+    
+    tide_params = _tide_params(api_key)
+    
+    # Pool de processus seulement pour les gros lots
+    max_workers = process_pool.size(process_pool.RENDER)
+    if len(segment_ids) < current_app.config.get("BATCH_EXPORT_PARALLEL_MIN", 8):
+        max_workers = 1
+    
+    current_app.logger.info(f"XYZ batch export of {len(segment_ids)} segment(s) ({max_workers} worker(s))")
+    entries = gpx_service.iter_xyz_batch_entries(
+        temp_dir, gpx_upload_id, segment_ids, tide_params,
+        tide_threads=current_app.config.get("TIDE_FETCH_THREADS", gpx_service.DEFAULT_TIDE_FETCH_THREADS),
+        max_workers=max_workers
+    )
+    return _attachment_response(converter_service.iter_zip_archive(entries), "segments_xyz.zip", "application/zip")
+
+
+def _load_job_or_404(job_id):
+    """État d'une tâche de conversion, ou 404."""
+    if not jobs.is_valid_job_id(job_id):
+        abort(404)
+    job = jobs.get_job(_cache_subdir("jobs"), job_id)
+    if job is None:
+        abort(404)
+    return job
+
+
+@main.route("/tools/gpx2xyz/jobs/<job_id>")
+def gpx2xyz_job(job_id):
+    """Page de suivi d'une conversion (étape 3)."""
+    return render_template("gpx2xyz_job.html", job=_load_job_or_404(job_id))
+
+
+@main.route("/tools/gpx2xyz/jobs/<job_id>/status")
+def gpx2xyz_job_status(job_id):
+    """État JSON d'une conversion (interrogé par la page de suivi)."""
+    job = _load_job_or_404(job_id)
+    return jsonify({
+        "status": job["status"],
+        "progress": job["progress"],
+        "message": job["message"],
+        "error": job["error"],
+        "result_name": job["result_name"],
+        "download_url": url_for("main.gpx2xyz_job_download", job_id=job_id) if job["status"] == "done" else None,
+    })
+
+
+@main.route("/tools/gpx2xyz/jobs/<job_id>/download")
+def gpx2xyz_job_download(job_id):
+    """Télécharge le fichier XYZ d'une conversion terminée."""
+    job = _load_job_or_404(job_id)
+    path = jobs.result_path(_cache_subdir("jobs"), job_id)
+    if path is None:
+        flash(job["error"] or "La conversion n'est pas encore terminée.", "error")
+        return redirect(url_for("main.gpx2xyz_job", job_id=job_id))
+    return send_file(
+        os.path.abspath(path),
+        as_attachment=True,
+        download_name=job["result_name"],
+        mimetype="text/plain"
+    )
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Cache des séries de marée décodées, devant le tide store SQLite.
+
+Une série est un couple (epochs, hauteurs) d'array('d') triés : un succès
+de cache est utilisable tel quel par l'interpolation.
+
+Niveau 1 : LRU en mémoire par processus, borné en octets.
+Niveau 2 (optionnel) : un fichier binaire par clé dans cache/worldtides/series,
+partagé entre les workers gunicorn et borné en octets (LRU par date de
+modification, voir utils.evict_lru_files).
+"""
+import os
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+
+from .utils import evict_lru_files
+
+DEFAULT_MEMORY_MAX_BYTES = 32 * 1024 * 1024   # 32 MB par worker
+DEFAULT_SHARED_MAX_BYTES = 128 * 1024 * 1024  # 128 MB sur disque
+
+# Fichier partagé : signature + nombre d'échantillons, puis epochs puis hauteurs (float64)
+_SERIES_HEADER = struct.Struct("<4sI")
+_SERIES_MAGIC = b"TDS1"
+_SERIES_SUFFIX = ".tide"
+
+_config = {
+    "memory_max_bytes": DEFAULT_MEMORY_MAX_BYTES,
+    "shared": True,
+    "shared_max_bytes": DEFAULT_SHARED_MAX_BYTES,
+}
+
+# Compteurs (par processus)
+stats = {"hits": 0, "shared_hits": 0, "misses": 0, "evictions": 0, "shared_evictions": 0}
+
+_memory = OrderedDict()  # clé -> (entrée, taille en octets)
+_memory_bytes = 0
+_memory_lock = threading.Lock()  # export groupé : marées récupérées dans des threads
+
+
+def configure(memory_max_bytes=None, shared=None, shared_max_bytes=None):
+    """Ajuste les limites du cache (appelé à la création de l'app)."""
+    if memory_max_bytes is not None:
+        _config["memory_max_bytes"] = int(memory_max_bytes)
+    if shared is not None:
+        _config["shared"] = bool(shared)
+    if shared_max_bytes is not None:
+        _config["shared_max_bytes"] = int(shared_max_bytes)
+    with _memory_lock:
+        _evict_memory()
+
+
+def clear():
+    """Vide le niveau mémoire."""
+    global _memory_bytes
+    with _memory_lock:
+        _memory.clear()
+        _memory_bytes = 0
+
+
+def memory_usage():
+    """(nombre d'entrées, octets estimés) du niveau mémoire."""
+    return len(_memory), _memory_bytes
+
+
+def _entry_bytes(epochs, heights):
+    """Taille d'une série en mémoire (tampons array('d') compris)."""
+    return sys.getsizeof(epochs) + sys.getsizeof(heights)
+
+
+def _evict_memory():
+    global _memory_bytes
+    while _memory and _memory_bytes > _config["memory_max_bytes"]:
+        _, (_, size) = _memory.popitem(last=False)
+        _memory_bytes -= size
+        stats["evictions"] += 1
+
+
+def _memory_put(key, entry):
+    global _memory_bytes
+    size = _entry_bytes(*entry)
+    if size > _config["memory_max_bytes"]:
+        return
+    with _memory_lock:
+        previous = _memory.pop(key, None)
+        if previous is not None:
+            _memory_bytes -= previous[1]
+        _memory[key] = (entry, size)
+        _memory_bytes += size
+        _evict_memory()
+
+
+# ----- Niveau partagé (fichiers) -----
+
+def _shared_path(shared_dir, key):
+    return os.path.join(shared_dir, f"{key}{_SERIES_SUFFIX}")
+
+
+def _shared_load(shared_dir, key):
+    """Lit une série depuis le niveau partagé, ou None."""
+    path = _shared_path(shared_dir, key)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < _SERIES_HEADER.size:
+        return None
+    magic, count = _SERIES_HEADER.unpack_from(data)
+    if magic != _SERIES_MAGIC or len(data) != _SERIES_HEADER.size + 16 * count:
+        return None
+    epochs, heights = array("d"), array("d")
+    offset = _SERIES_HEADER.size
+    epochs.frombytes(data[offset:offset + 8 * count])
+    heights.frombytes(data[offset + 8 * count:])
+    # LRU : la date de modification sert de date de dernier accès
+    os.utime(path)
+    return epochs, heights
+
+
+def _shared_save(shared_dir, key, epochs, heights, logger=None):
+    """Écrit une série dans le niveau partagé (écriture atomique) puis applique l'éviction."""
+    os.makedirs(shared_dir, exist_ok=True)
+    path = _shared_path(shared_dir, key)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_SERIES_HEADER.pack(_SERIES_MAGIC, len(epochs)))
+        f.write(epochs.tobytes())
+        f.write(heights.tobytes())
+    os.replace(tmp_path, path)
+    _evict_shared(shared_dir, logger)
+
+
+def _evict_shared(shared_dir, logger=None):
+    """Supprime les séries les moins récemment utilisées au-delà de la limite."""
+    removed, failed = evict_lru_files(shared_dir, _SERIES_SUFFIX, _config["shared_max_bytes"])
+    stats["shared_evictions"] += len(removed)
+    if logger is not None:
+        for path in removed:
+            logger.debug(f"Tide series cache evicted {os.path.basename(path)}")
+        for path, e in failed:
+            logger.warning(f"Tide series cache eviction failed for {path}: {e}")
+
+
+# ----- API -----
+
+def get(key, shared_dir=None):
+    """
+    Série (epochs, heights) en cache pour la clé, ou None.
+
+    Un succès sur le niveau partagé remonte l'entrée dans le niveau mémoire.
+    """
+    with _memory_lock:
+        cached = _memory.get(key)
+        if cached is not None:
+            _memory.move_to_end(key)
+            stats["hits"] += 1
+            return cached[0]
+
+    if shared_dir and _config["shared"]:
+        entry = _shared_load(shared_dir, key)
+        if entry is not None:
+            stats["shared_hits"] += 1
+            _memory_put(key, entry)
+            return entry
+
+    stats["misses"] += 1
+    return None
+
+
+def put(key, epochs, heights, shared_dir=None, logger=None):
+    """
+    Enregistre une série (array('d') triés) en mémoire et, si activé, dans le
+    niveau partagé. `logger` reçoit les évictions du niveau partagé.
+    """
+    _memory_put(key, (epochs, heights))
+    if shared_dir and _config["shared"]:
+        _shared_save(shared_dir, key, epochs, heights, logger)
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Client HTTP de l'API WorldTides.
+
+- une session requests par processus (connexions keep-alive réutilisées) ;
+- réessais bornés avec backoff exponentiel et jitter sur les erreurs
+  transitoires (connexion, timeout, 429, 5xx) ;
+- disjoncteur : après plusieurs appels en échec consécutifs, les appels
+  échouent immédiatement pendant un délai de refroidissement ; ensuite un seul
+  appel d'essai passe (demi-ouvert) pendant que les autres échouent encore,
+  et son résultat referme le disjoncteur ou le rouvre pour un nouveau délai.
+"""
+import os
+import random
+import threading
+import time
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    requests = None
+    HTTPAdapter = None
+
+from .exceptions import TideApiError, TideCircuitOpenError
+
+DEFAULT_TIMEOUT = 20             # secondes par tentative
+DEFAULT_RETRIES = 2              # tentatives supplémentaires après la première
+DEFAULT_BACKOFF = 0.5            # secondes, doublé à chaque tentative
+DEFAULT_BACKOFF_MAX = 8.0
+DEFAULT_BREAKER_THRESHOLD = 5    # appels en échec consécutifs avant ouverture
+DEFAULT_BREAKER_COOLDOWN = 60.0  # secondes
+
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_config = {
+    "timeout": DEFAULT_TIMEOUT,
+    "retries": DEFAULT_RETRIES,
+    "backoff": DEFAULT_BACKOFF,
+    "backoff_max": DEFAULT_BACKOFF_MAX,
+    "breaker_threshold": DEFAULT_BREAKER_THRESHOLD,
+    "breaker_cooldown": DEFAULT_BREAKER_COOLDOWN,
+}
+
+# État par processus (la session n'est pas partagée après un fork)
+# open_until > 0 : disjoncteur ouvert (ou demi-ouvert une fois le délai écoulé)
+_state = {"session": None, "pid": None, "failures": 0, "open_until": 0.0, "trial": False}
+_lock = threading.Lock()
+
+
+def configure(timeout=None, retries=None, backoff=None, breaker_threshold=None, breaker_cooldown=None):
+    """Ajuste les paramètres du client (appelé à la création de l'app)."""
+    for name, value in (("timeout", timeout), ("retries", retries), ("backoff", backoff),
+                        ("breaker_threshold", breaker_threshold), ("breaker_cooldown", breaker_cooldown)):
+        if value is not None:
+            _config[name] = value
+
+
+def reset():
+    """Ferme la session et remet le disjoncteur à zéro."""
+    with _lock:
+        if _state["session"] is not None:
+            _state["session"].close()
+        _state.update(session=None, pid=None, failures=0, open_until=0.0, trial=False)
+
+
+def _get_session():
+    """Session requests du processus courant (recréée après un fork)."""
+    with _lock:
+        if _state["session"] is None or _state["pid"] != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _state.update(session=session, pid=os.getpid())
+        return _state["session"]
+
+
+def _check_breaker():
+    """
+    Autorise l'appel ou lève TideCircuitOpenError.
+
+    Retourne True si l'appel est l'essai du disjoncteur demi-ouvert : il doit
+    alors se terminer par _record_success/_record_failure ou _end_trial.
+    """
+    with _lock:
+        if not _state["open_until"]:
+            return False
+        remaining = _state["open_until"] - time.monotonic()
+        if remaining <= 0 and not _state["trial"]:
+            _state["trial"] = True
+            return True
+    if remaining > 0:
+        raise TideCircuitOpenError(
+            f"Service WorldTides indisponible, nouvel essai possible dans {remaining:.0f} s"
+        )
+    raise TideCircuitOpenError("Service WorldTides indisponible, appel d'essai en cours")
+
+
+def _end_trial():
+    """Libère l'essai sans verdict (erreur inattendue) : le prochain appel réessaiera."""
+    with _lock:
+        _state["trial"] = False
+
+
+def _record_success():
+    with _lock:
+        _state.update(failures=0, open_until=0.0, trial=False)
+
+
+def _record_failure():
+    with _lock:
+        _state["failures"] += 1
+        if _state["failures"] >= _config["breaker_threshold"]:
+            _state["open_until"] = time.monotonic() + _config["breaker_cooldown"]
+        _state["trial"] = False
+
+
+def _backoff_delay(attempt, retry_after=None):
+    """Délai avant la tentative suivante : exponentiel avec jitter complet, ou Retry-After."""
+    if retry_after is not None:
+        return min(retry_after, _config["backoff_max"])
+    return random.uniform(0, min(_config["backoff_max"], _config["backoff"] * (2 ** attempt)))
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def get_json(url, logger=None):
+    """
+    GET url et retourne le JSON décodé.
+
+    Lève TideCircuitOpenError si le disjoncteur est ouvert, TideApiError après
+    épuisement des réessais ou sur une erreur non transitoire (4xx).
+    """
+    if requests is None:
+        raise ImportError("La bibliothèque 'requests' est requise pour WorldTides")
+
+    trial = _check_breaker()
+    try:
+        return _get_json_with_retries(url, logger)
+    finally:
+        if trial:
+            _end_trial()
+
+
+def _get_json_with_retries(url, logger):
+    """Tentatives d'un appel get_json, disjoncteur déjà vérifié."""
+    session = _get_session()
+    last_error = None
+
+    for attempt in range(_config["retries"] + 1):
+        retry_after = None
+        try:
+            response = session.get(url, timeout=_config["timeout"])
+            if response.status_code in _RETRY_STATUSES:
+                retry_after = _retry_after(response)
+                last_error = f"HTTP {response.status_code}"
+                response.close()
+            else:
+                response.raise_for_status()
+                data = response.json()
+                _record_success()
+                return data
+        except requests.HTTPError as e:
+            # Erreur client (clé invalide, paramètres...) : inutile de réessayer,
+            # et le service lui-même répond
+            _record_success()
+            raise TideApiError(f"Erreur lors de l'appel à WorldTides: {e}")
+        except (requests.ConnectionError, requests.Timeout, ValueError) as e:
+            last_error = str(e)
+        except requests.RequestException as e:
+            raise TideApiError(f"Erreur lors de l'appel à WorldTides: {e}")
+
+        if attempt < _config["retries"]:
+            delay = _backoff_delay(attempt, retry_after)
+            if logger is not None:
+                logger.warning(
+                    f"WorldTides: échec tentative {attempt + 1} ({last_error}), nouvel essai dans {delay:.1f} s"
+                )
+            time.sleep(delay)
+
+    _record_failure()
+    raise TideApiError(f"Erreur lors de l'appel à WorldTides: {last_error}")
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+Stockage persistant des séries de marée WorldTides (SQLite).
+
+Une série est identifiée par sa cellule : (url, lat, lon, pas, datum). Chaque
+appel API donne un bloc (chunk) : l'intervalle couvert et ses échantillons
+triés, stockés en deux BLOB float64 (epochs, hauteurs) relus sans parsing.
+Une requête ne déclenche d'appel que pour les sous-intervalles manquants.
+"""
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import closing, contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+TIDE_DB_FILENAME = "tides.sqlite3"
+LOCKS_SUBDIR = "locks"
+DEFAULT_LOCK_TIMEOUT = 60  # secondes (au-delà : appel API sans attendre)
+EARTH_RADIUS_KM = 6371.0088
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cells (
+    cell_id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    step INTEGER NOT NULL,
+    datum TEXT NOT NULL,
+    UNIQUE (url, lat, lon, step, datum)
+);
+CREATE INDEX IF NOT EXISTS cells_position ON cells (url, step, datum, lat, lon);
+CREATE TABLE IF NOT EXISTS chunks (
+    cell_id INTEGER NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    epochs BLOB NOT NULL,
+    heights BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_cell ON chunks (cell_id, start);
+"""
+
+# Bases dont le schéma a déjà été créé par ce processus
+_initialized_paths = set()
+
+
+def db_path(cache_dir):
+    """Chemin de la base de marées dans le répertoire de cache."""
+    return os.path.join(cache_dir, TIDE_DB_FILENAME)
+
+
+def _connect(path):
+    """
+    Ouvre la base ; WAL pour les accès concurrents des workers.
+
+    Le schéma (et le mode WAL, persistant) n'est appliqué qu'à la première
+    connexion du processus, ou si le fichier a été supprimé entre-temps.
+    """
+    fresh = path not in _initialized_paths or not os.path.exists(path)
+    if fresh:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    if fresh:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _initialized_paths.add(path)
+    return conn
+
+
+def _cell_id(conn, cell, create=False):
+    """Identifiant de la cellule {url, lat, lon, step, datum} (None si inconnue)."""
+    values = (cell["url"], cell["lat"], cell["lon"], cell["step"], cell["datum"])
+    row = conn.execute(
+        "SELECT cell_id FROM cells WHERE url=? AND lat=? AND lon=? AND step=? AND datum=?", values
+    ).fetchone()
+    if row:
+        return row[0]
+    if not create:
+        return None
+    cur = conn.execute("INSERT INTO cells (url, lat, lon, step, datum) VALUES (?, ?, ?, ?, ?)", values)
+    return cur.lastrowid
+
+
+def _distance_km(lat1, lon1, lat2, lon2):
+    """Distance orthodromique (haversine) en kilomètres."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _lon_windows(lon_min, lon_max):
+    """
+    Intervalles de longitude [min, max] dans [-180, 180] couvrant lon_min..lon_max :
+    deux intervalles si la plage traverse l'antiméridien.
+    """
+    if lon_max - lon_min >= 360.0:
+        return [(-180.0, 180.0)]
+    if lon_min < -180.0:
+        return [(lon_min + 360.0, 180.0), (-180.0, lon_max)]
+    if lon_max > 180.0:
+        return [(lon_min, 180.0), (-180.0, lon_max - 360.0)]
+    return [(lon_min, lon_max)]
+
+
+def find_nearby_cell(path, cell, max_km):
+    """
+    Cellule déjà en cache la plus proche de `cell` (mêmes url/pas/datum) à moins
+    de max_km, ou None. Retourne (cellule, distance_km).
+
+    Préfiltre par boîte englobante sur l'index (url, step, datum, lat, lon),
+    puis distance exacte sur les quelques candidats.
+    """
+    if not max_km or max_km <= 0 or not os.path.exists(path):
+        return None
+    dlat = max_km / 111.0
+    cos_lat = math.cos(math.radians(min(89.0, abs(cell["lat"]))))
+    dlon = min(180.0, max_km / (111.0 * cos_lat))
+    windows = _lon_windows(cell["lon"] - dlon, cell["lon"] + dlon)
+    with closing(_connect(path)) as conn:
+        rows = conn.execute(
+            "SELECT lat, lon FROM cells WHERE url=? AND step=? AND datum=? AND lat BETWEEN ? AND ? "
+            "AND (" + " OR ".join(["lon BETWEEN ? AND ?"] * len(windows)) + ")",
+            (cell["url"], cell["step"], cell["datum"], cell["lat"] - dlat, cell["lat"] + dlat,
+             *(bound for window in windows for bound in window)),
+        ).fetchall()
+
+    best = None
+    for lat, lon in rows:
+        dist = _distance_km(cell["lat"], cell["lon"], lat, lon)
+        if dist <= max_km and (best is None or dist < best[1]):
+            best = (dict(cell, lat=lat, lon=lon), dist)
+    return best
+
+
+def _chunk_filter(ttl_hours):
+    """Condition SQL (et paramètres) excluant les blocs expirés."""
+    if ttl_hours and ttl_hours > 0:
+        return " AND fetched_at>=?", [time.time() - ttl_hours * 3600]
+    return "", []
+
+
+@contextmanager
+def cell_lock(path, cell, timeout=DEFAULT_LOCK_TIMEOUT):
+    """
+    Verrou exclusif inter-processus (flock) sur une cellule, pour qu'un seul
+    worker appelle l'API pendant que les autres attendent son résultat.
+
+    Fournit le temps d'attente en secondes, ou None si le verrou n'a pas pu
+    être pris (fcntl absent, timeout) : l'appelant continue alors sans verrou.
+    """
+    if fcntl is None:
+        yield None
+        return
+
+    lock_dir = os.path.join(os.path.dirname(path), LOCKS_SUBDIR)
+    os.makedirs(lock_dir, exist_ok=True)
+    name = hashlib.sha256(json.dumps(cell, sort_keys=True).encode("utf-8")).hexdigest()
+    started = time.monotonic()
+    with open(os.path.join(lock_dir, f"{name}.lock"), "a+b") as f:
+        while True:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() - started >= timeout:
+                    yield None
+                    return
+                time.sleep(0.1)
+        try:
+            yield time.monotonic() - started
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def missing_ranges(path, cell, start, end, ttl_hours=0.0):
+    """
+    Sous-intervalles de [start, end] (secondes epoch) non couverts pour la cellule.
+
+    Les blocs récupérés il y a plus de ttl_hours (si > 0) sont ignorés.
+    """
+    with closing(_connect(path)) as conn:
+        cell_id = _cell_id(conn, cell)
+        if cell_id is None:
+            return [(start, end)]
+        extra, extra_params = _chunk_filter(ttl_hours)
+        covered = conn.execute(
+            "SELECT start, end FROM chunks WHERE cell_id=? AND start<=? AND end>=?" + extra + " ORDER BY start",
+            [cell_id, end, start] + extra_params,
+        ).fetchall()
+
+    gaps = []
+    cursor = start
+    for c_start, c_end in covered:
+        if c_start > cursor:
+            gaps.append((cursor, c_start))
+        cursor = max(cursor, c_end)
+        if cursor >= end:
+            break
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def store_samples(path, cell, start, end, samples, ttl_hours=0.0):
+    """
+    Enregistre le bloc [(epoch, hauteur)] récupéré pour [start, end].
+
+    Les échantillons sont triés une fois ici ; les blocs expirés de la cellule
+    sont supprimés.
+    """
+    samples = sorted(samples, key=lambda x: x[0])
+    epochs = array("d", (t for t, _ in samples))
+    heights = array("d", (h for _, h in samples))
+    with closing(_connect(path)) as conn, conn:
+        cell_id = _cell_id(conn, cell, create=True)
+        if ttl_hours and ttl_hours > 0:
+            conn.execute(
+                "DELETE FROM chunks WHERE cell_id=? AND fetched_at<?",
+                (cell_id, time.time() - ttl_hours * 3600),
+            )
+        conn.execute(
+            "INSERT INTO chunks (cell_id, start, end, fetched_at, epochs, heights) VALUES (?, ?, ?, ?, ?, ?)",
+            (cell_id, start, end, time.time(), epochs.tobytes(), heights.tobytes()),
+        )
+
+
+def load_samples(path, cell, start, end, ttl_hours=0.0):
+    """
+    Échantillons de la cellule dans [start, end], triés : (epochs, heights) en array('d').
+
+    Les blocs se touchent aux bornes : un échantillon déjà présent n'est pas dupliqué.
+    """
+    epochs, heights = array("d"), array("d")
+    with closing(_connect(path)) as conn:
+        cell_id = _cell_id(conn, cell)
+        if cell_id is None:
+            return epochs, heights
+        extra, extra_params = _chunk_filter(ttl_hours)
+        rows = conn.execute(
+            "SELECT epochs, heights FROM chunks WHERE cell_id=? AND start<=? AND end>=?" + extra + " ORDER BY start",
+            [cell_id, end, start] + extra_params,
+        ).fetchall()
+
+    for epochs_blob, heights_blob in rows:
+        chunk_epochs, chunk_heights = array("d"), array("d")
+        chunk_epochs.frombytes(epochs_blob)
+        chunk_heights.frombytes(heights_blob)
+        lo = bisect_left(chunk_epochs, start)
+        hi = bisect_right(chunk_epochs, end)
+        if epochs:
+            lo = max(lo, bisect_right(chunk_epochs, epochs[-1]))
+        epochs.extend(chunk_epochs[lo:hi])
+        heights.extend(chunk_heights[lo:hi])
+    return epochs, heights
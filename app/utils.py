@@ -1,3 +1,5 @@
+import os
+
 def minutes_to_degrees(minutes):
     return float(minutes) / 60.0
 
@@ -7,3 +9,32 @@ def is_float(value):
         return True
     except ValueError:
         return False
+
+def evict_lru_files(directory, suffix, max_bytes):
+    """
+    Supprime les fichiers *suffix de directory les moins récemment modifiés
+    (mtime, rafraîchi à chaque lecture par les caches) jusqu'à ce que leur
+    taille totale ne dépasse plus max_bytes.
+
+    Retourne: (chemins supprimés, [(chemin, OSError)] pour les échecs)
+    """
+    entries = []
+    total = 0
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.name.endswith(suffix):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+    entries.sort()
+    removed, failed = [], []
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            removed.append(path)
+        except OSError as e:
+            failed.append((path, e))
+    return removed, failed
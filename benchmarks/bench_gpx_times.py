@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark du décodage des dates GPX : décodage par lot (NumPy) vs _iso8601_to_epoch.
+
+Vérifie aussi que les deux chemins donnent le même résultat, y compris sur des
+dates mal formées de la même longueur que les dispositions fixes.
+
+Usage :
+    python benchmarks/bench_gpx_times.py [nb_dates]
+"""
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app import gpx_service  # noqa: E402
+
+# Une variante valide et une invalide par disposition fixe (19, 20, 23, 24, 26, 27 caractères)
+EDGE_CASES = [
+    "2024-01-01T10:00:00",
+    "2024-01-01T10:00:00Z",
+    "2024-01-01T10:00:00X",
+    "2024-01-01T10:00:00.123",
+    "2024-01-01T10:00:00.123Z",
+    "2024-01-01T10:00:00.123X",
+    "2024-01-01T10:00:00.123456",
+    "2024-01-01T10:00:00.123456Z",
+    "2024-01-01T10:00:00.123456X",
+    "2024-01-01T10:00:00.123456+",
+    "2024-01-01T10:00:00+01:00",
+    "2024-02-30T10:00:00Z",
+    "2024-01-01T24:00:00Z",
+    "",
+    None,
+]
+
+
+def build_times(nb_dates, seed=42):
+    """Dates à 1 Hz sur plusieurs jours, dans les formats rencontrés dans les GPX."""
+    rng = random.Random(seed)
+    start = datetime(2025, 6, 1, 10, 0, tzinfo=timezone.utc)
+    texts = []
+    for i in range(nb_dates):
+        dt = start + timedelta(seconds=i, microseconds=rng.choice((0, 250000, 123456)))
+        fmt = rng.choice(("%Y-%m-%dT%H:%M:%SZ", "%Y-%m-%dT%H:%M:%S.%fZ", "%Y-%m-%dT%H:%M:%S.%f"))
+        texts.append(dt.strftime(fmt))
+    return texts + EDGE_CASES
+
+
+def same(a, b):
+    return (math.isnan(a) and b is None) or a == b
+
+
+def main():
+    nb_dates = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    texts = build_times(nb_dates)
+    print(f"{len(texts)} dates")
+
+    start = time.perf_counter()
+    reference = [gpx_service._iso8601_to_epoch(txt) if txt else None for txt in texts]
+    t_scalar = time.perf_counter() - start
+
+    start = time.perf_counter()
+    epochs = gpx_service._decode_iso8601_batch(texts)
+    t_batch = time.perf_counter() - start
+
+    mismatches = [txt for txt, a, b in zip(texts, epochs, reference) if not same(a, b)]
+    assert not mismatches, f"Les deux chemins divergent : {mismatches[:5]}"
+    print(f"date par date : {t_scalar:.2f} s")
+    print(f"par lot       : {t_batch:.2f} s  (x{t_scalar / t_batch:.1f})")
+
+
+if __name__ == "__main__":
+    main()
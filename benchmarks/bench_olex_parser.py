@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark du parsing Olex : conversion vectorisée (NumPy) vs ligne à ligne.
+
+Usage :
+    python benchmarks/bench_olex_parser.py [nb_routes] [points_par_route]
+"""
+import gzip
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from flask import Flask  # noqa: E402
+from app import converter_service  # noqa: E402
+
+
+def build_plot(nb_routes, nb_points, seed=42):
+    """Construit un olexplot.gz synthétique en mémoire."""
+    rng = random.Random(seed)
+    out = []
+    for r in range(nb_routes):
+        out.append("Rute uten navn")
+        out.append("Rutetype Strek")
+        out.append("Plottsett 8")
+        lat, lon = 3600.0 + r, 300.0 - r
+        for i in range(nb_points):
+            lat += rng.uniform(-0.5, 0.5)
+            lon += rng.uniform(-0.5, 0.5)
+            out.append(f"{lat:.6f} {lon:.6f} {1700000000 + i} Brunsirkel")
+            if i % 100 == 0:
+                out.append(f"Navn WP{i}")
+    return gzip.compress(("\n".join(out) + "\n").encode("utf-8"))
+
+
+def run(data, vectorized):
+    start = time.perf_counter()
+    with gzip.open(io.BytesIO(data), "rt", encoding="utf-8", errors="ignore") as f:
+        routes = list(converter_service._iter_routes_from_lines(f, vectorized=vectorized))
+    return time.perf_counter() - start, routes
+
+
+def main():
+    nb_routes = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    nb_points = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    data = build_plot(nb_routes, nb_points)
+    print(f"{nb_routes} routes x {nb_points} points ({len(data) / (1024 * 1024):.1f} MB gz)")
+
+    app = Flask(__name__)
+    with app.app_context():
+        app.logger.disabled = True
+        t_lines, ref = run(data, vectorized=False)
+        t_vec, routes = run(data, vectorized=True)
+
+    assert [r.to_bytes() for r in routes] == [r.to_bytes() for r in ref], "Les deux chemins de parsing divergent"
+    print(f"ligne à ligne : {t_lines:.2f} s")
+    print(f"vectorisé     : {t_vec:.2f} s  (x{t_lines / t_vec:.1f})")
+
+
+if __name__ == "__main__":
+    main()
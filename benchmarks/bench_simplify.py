@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de la simplification Douglas-Peucker : NumPy (par niveaux) vs Python pur.
+
+Usage :
+    python benchmarks/bench_simplify.py [nb_points] [tolerance_m] [max_points]
+"""
+import math
+import os
+import random
+import sys
+import time
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app import geometry  # noqa: E402
+
+
+def build_track(nb_points, seed=42):
+    """Trace synthétique : sinusoïde de ~5 km d'amplitude avec un bruit GPS de quelques mètres."""
+    rng = random.Random(seed)
+    lats, lons = array("d"), array("d")
+    for i in range(nb_points):
+        lats.append(60.0 + 0.05 * math.sin(i / 5000) + rng.gauss(0, 2e-5))
+        lons.append(5.0 + i * 3e-5 + rng.gauss(0, 4e-5))
+    return lats, lons
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def run(lats, lons, tolerance, max_points):
+    t_tol, by_tolerance = timed(geometry.simplify_indices, lats, lons, tolerance)
+    t_count, by_count = timed(geometry.simplify_to_count, lats, lons, max_points)
+    return t_tol, by_tolerance, t_count, by_count
+
+
+def main():
+    nb_points = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    tolerance = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+    max_points = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+    lats, lons = build_track(nb_points)
+    print(f"{nb_points} points, tolérance {tolerance} m, cible {max_points} points")
+
+    if geometry.np is None:
+        print("NumPy absent : seul le chemin Python pur est disponible")
+        return
+    t_tol, by_tolerance, t_count, by_count = run(lats, lons, tolerance, max_points)
+
+    numpy_module, geometry.np = geometry.np, None
+    try:
+        p_tol, ref_tolerance, p_count, ref_count = run(lats, lons, tolerance, max_points)
+    finally:
+        geometry.np = numpy_module
+
+    assert by_tolerance == ref_tolerance and by_count == ref_count, "Les deux chemins divergent"
+    print(f"tolérance : {len(by_tolerance)} points, Python {p_tol * 1000:.0f} ms, NumPy {t_tol * 1000:.0f} ms")
+    print(f"cible     : {len(by_count)} points, Python {p_count * 1000:.0f} ms, NumPy {t_count * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de l'export XYZ : calcul des sondes vectorisé (NumPy) vs point par point.
+
+Vérifie d'abord les deux chemins sur un fichier de référence (data/xyz_reference.*,
+résultat produit par le code d'origine, avant la vectorisation), puis qu'ils
+produisent le même fichier octet pour octet sur le segment synthétique.
+
+Usage :
+    python benchmarks/bench_xyz_export.py [nb_points]
+"""
+import json
+import os
+import random
+import sys
+import time
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app import gpx_service  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def check_reference():
+    """Compare les deux chemins au XYZ attendu pour data/xyz_reference.gpx."""
+    with open(os.path.join(DATA_DIR, "xyz_reference.json"), encoding="utf-8") as f:
+        reference = json.load(f)
+    with open(os.path.join(DATA_DIR, "xyz_reference.xyz"), "rb") as f:
+        expected = f.read()
+    with open(os.path.join(DATA_DIR, "xyz_reference.gpx"), "rb") as f:
+        segments = gpx_service.parse_gpx_file(f)
+    segment = next(seg for seg in segments if seg["segment_id"] == reference["segment_id"])
+    tide = (array("d", reference["tide_epochs"]), array("d", reference["tide_heights"]))
+
+    for vectorized in (False, True):
+        filename, output = gpx_service.generate_xyz_file(segment, tide, vectorized=vectorized)
+        assert filename == reference["filename"], (vectorized, filename)
+        assert output.getvalue() == expected, f"XYZ différent de la référence (vectorized={vectorized})"
+    print(f"référence : {len(expected.splitlines())} lignes identiques au XYZ d'origine")
+
+
+def build_segment(nb_points, seed=42):
+    """Construit un segment synthétique (1 point/s, quelques profondeurs manquantes)."""
+    rng = random.Random(seed)
+    start = 1748772000.0
+    times, lats, lons, depths = array("d"), array("d"), array("d"), array("d")
+    lat, lon = 47.5, -3.1
+    for i in range(nb_points):
+        lat += rng.uniform(-1e-5, 1e-5)
+        lon += rng.uniform(-1e-5, 1e-5)
+        times.append(start + i + rng.choice((0.0, 0.25, 0.5)))
+        lats.append(lat)
+        lons.append(lon)
+        depths.append(gpx_service.NAN if i % 997 == 0 else round(rng.uniform(2.0, 40.0), 2))
+    return {"segment_id": 1, "times": times, "lats": lats, "lons": lons, "depths": depths}
+
+
+def build_tide(segment, step_minutes=10):
+    """Série de marée synthétique couvrant le segment (même forme que fetch_worldtides_heights)."""
+    t0 = float(int(segment["times"][0]) // 3600 * 3600 - 3600)
+    t1 = segment["times"][-1] + 3600
+    epochs, heights = array("d"), array("d")
+    t = t0
+    while t <= t1:
+        epochs.append(t)
+        heights.append(round(2.5 + 2.0 * ((t - t0) % 44700) / 44700, 3))
+        t += step_minutes * 60
+    return epochs, heights
+
+
+def run(segment, tide, vectorized):
+    start = time.perf_counter()
+    filename, output = gpx_service.generate_xyz_file(segment, tide, vectorized=vectorized)
+    return time.perf_counter() - start, filename, output.getvalue()
+
+
+def main():
+    check_reference()
+
+    nb_points = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    segment = build_segment(nb_points)
+    tide = build_tide(segment)
+    print(f"{nb_points} points, {len(tide[0])} échantillons de marée")
+
+    t_scalar, ref_name, ref = run(segment, tide, vectorized=False)
+    t_vec, name, data = run(segment, tide, vectorized=True)
+
+    assert name == ref_name and data == ref, "Les deux chemins d'export divergent"
+    print(f"point par point : {t_scalar:.2f} s")
+    print(f"vectorisé       : {t_vec:.2f} s  (x{t_scalar / t_vec:.1f})")
+
+
+if __name__ == "__main__":
+    main()